@@ -3,8 +3,9 @@ import os
 import asyncio
 from typing import Dict, List
 from datetime import datetime
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
 import uvicorn
 
@@ -13,6 +14,27 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.database.postgres import get_db
 
+TODAYS_RECOMMENDATIONS_QUERY = text("""
+    SELECT
+        id,
+        symbol,
+        timestamp,
+        price AS recommended_price,
+        signal_type,
+        signal_strength,
+        target,
+        buy_price,
+        stop_loss
+    FROM
+        signal_history
+    WHERE
+        timestamp >= date_trunc('day', NOW())
+        AND signal_type IN ('BUY', 'STRONG_BUY')
+        AND signal_strength >= 0.7
+    ORDER BY
+        timestamp DESC;
+""")
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Trading Recommendations API",
@@ -30,38 +52,17 @@ app.add_middleware(
 )
 
 @app.get("/api/recommendations", summary="Fetch Today's Trading Recommendations")
-async def get_recommendations() -> List[Dict]:
+def get_recommendations(db: Session = Depends(get_db)) -> List[Dict]:
     """
     Fetches all of today's trading recommendations from the database
     with a signal strength of 0.7 or higher.
+
+    Declared as a plain function so FastAPI runs the blocking query in its
+    threadpool instead of on the event loop.
     """
-    db = next(get_db())
-    query = text("""
-        SELECT
-            id,
-            symbol,
-            timestamp,
-            price AS recommended_price,
-            signal_type,
-            signal_strength,
-            target,
-            buy_price,
-            stop_loss
-        FROM
-            signal_history
-        WHERE
-            timestamp >= date_trunc('day', NOW())
-            AND signal_type IN ('BUY', 'STRONG_BUY')
-            AND signal_strength >= 0.7
-        ORDER BY
-            timestamp DESC;
-    """)
-    try:
-        results = db.execute(query).fetchall()
-        # Convert SQLAlchemy Row objects to dictionaries
-        return [dict(row._mapping) for row in results]
-    finally:
-        db.close()
+    results = db.execute(TODAYS_RECOMMENDATIONS_QUERY).fetchall()
+    # Convert SQLAlchemy Row objects to dictionaries
+    return [dict(row._mapping) for row in results]
 
 if __name__ == "__main__":
     print("Starting FastAPI server...")
@@ -1,11 +1,12 @@
 import sys
 import os
+import json
 import asyncio
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, time
 
-import aiohttp
+import numpy as np
 from sqlalchemy.sql import text
 
 # Add the project root directory to Python path
@@ -14,12 +15,75 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from src.database.postgres import get_db
 from src.services.market_data import MarketDataService
 from src.utils.config import load_config
+from src.utils.event_loop import install_uvloop
 from src.utils.rate_limiter import RateLimiter
 
 # --- Configuration ---
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
 config = load_config()
 
+# symbol -> asset_id mappings are near-static, so they are cached on disk per day
+ASSET_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'trader')
+ASSET_CACHE_MAX_AGE_SECONDS = 6 * 60 * 60
+
+FIVE_MINUTES_MS = 5 * 60 * 1000
+
+TODAYS_RECOMMENDATIONS_QUERY = text("""
+    SELECT
+        id,
+        symbol,
+        timestamp,
+        price AS recommended_price,
+        signal_type,
+        signal_strength,
+        target,
+        buy_price,
+        stop_loss
+    FROM
+        signal_history
+    WHERE
+        timestamp >= date_trunc('day', NOW()) AND timestamp < '2025-07-13 14:30:00'
+        AND signal_type IN ('BUY', 'STRONG_BUY')
+    ORDER BY
+        timestamp ASC; -- Order chronologically to process trades in order
+""")
+
+
+def resolve_trade(lows: np.ndarray, highs: np.ndarray, buy_price: Optional[float],
+                  target_price: Optional[float], stop_loss_price: Optional[float]) -> Tuple[str, float]:
+    """
+    Resolves the outcome of a single recommendation from its post-recommendation candles.
+
+    The trade is entered on the first candle whose range contains the buy price. From that
+    candle onwards, the first candle reaching the target is a WIN and the first candle touching
+    the stop-loss is a LOSS; when both happen in the same candle the target is checked first.
+
+    Returns:
+        Tuple of (status, pnl) where status is PENDING, ENTERED, WIN or LOSS
+    """
+    if not buy_price:
+        return "PENDING", 0.0
+
+    entered = (lows <= buy_price) & (highs >= buy_price)
+    if not entered.any():
+        return "PENDING", 0.0
+
+    first_entry = int(entered.argmax())
+    lows = lows[first_entry:]
+    highs = highs[first_entry:]
+
+    win = highs >= target_price if target_price else np.zeros(len(highs), dtype=bool)
+    loss = lows <= stop_loss_price if stop_loss_price else np.zeros(len(lows), dtype=bool)
+    resolved = win | loss
+
+    # A single argmax finds the first resolving candle; WIN takes precedence within it
+    idx = int(resolved.argmax())
+    if not resolved[idx]:
+        return "ENTERED", 0.0
+    if win[idx]:
+        return "WIN", target_price - buy_price
+    return "LOSS", buy_price - stop_loss_price # Loss is positive for calculation
+
 
 class PerformanceAnalyzer:
     """
@@ -36,31 +100,16 @@ class PerformanceAnalyzer:
         self.market_data_service = MarketDataService(config, self.rate_limiter)
         self.logger = logging.getLogger(__name__)
 
+    async def aclose(self):
+        """Closes the market data service's HTTP session."""
+        await self.market_data_service.aclose()
+
     async def get_todays_recommendations(self, min_strength: float = 0.7) -> List[Dict]:
         """Fetches all recommendations from the database for the current day."""
         self.logger.info(f"Querying database for today's recommendations with minimum strength {min_strength}...")
-        query = text("""
-            SELECT
-                id,
-                symbol,
-                timestamp,
-                price AS recommended_price,
-                signal_type,
-                signal_strength,
-                target,
-                buy_price,
-                stop_loss
-            FROM
-                signal_history
-            WHERE
-                timestamp >= date_trunc('day', NOW()) AND timestamp < '2025-07-13 14:30:00'
-                AND signal_type IN ('BUY', 'STRONG_BUY')
-            ORDER BY
-                timestamp ASC; -- Order chronologically to process trades in order
-        """)
         try:
             loop = asyncio.get_running_loop()
-            results = await loop.run_in_executor(None, lambda: self.db.execute(query, {'min_strength': min_strength}).fetchall())
+            results = await loop.run_in_executor(None, lambda: self.db.execute(TODAYS_RECOMMENDATIONS_QUERY, {'min_strength': min_strength}).fetchall())
             
             recommendations = [dict(row._mapping) for row in results]
             self.logger.info(f"Found {len(recommendations)} recommendations in the database.")
@@ -69,19 +118,85 @@ class PerformanceAnalyzer:
             self.logger.error(f"Failed to fetch today's recommendations: {e}")
             return []
 
-    async def get_intraday_data_after_time(self, session: aiohttp.ClientSession, asset_id: str, rec_timestamp: datetime) -> List[Dict]:
+    async def get_symbol_to_asset_id(self) -> Dict[str, str]:
         """
-        Fetches the 5-minute candle data for the rest of the day after a recommendation.
+        Returns the symbol -> asset_id mapping, loading today's on-disk cache when it is
+        fresh and fetching (then caching) the market data otherwise.
         """
         now = datetime.now()
+        cache_path = os.path.join(ASSET_CACHE_DIR, f"assets-{now.strftime('%Y%m%d')}.json")
+
+        try:
+            if now.timestamp() - os.path.getmtime(cache_path) < ASSET_CACHE_MAX_AGE_SECONDS:
+                with open(cache_path, 'r') as f:
+                    return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        all_assets = await self.market_data_service.fetch_market_data(config['api_settings']['headers'])
+        symbol_to_asset_id = {asset['symbol']: asset['asset_id'] for asset in all_assets if 'symbol' in asset and 'asset_id' in asset}
+
+        if symbol_to_asset_id:
+            try:
+                os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+                with open(cache_path, 'w') as f:
+                    json.dump(symbol_to_asset_id, f)
+            except OSError as e:
+                self.logger.warning(f"Could not write asset cache to {cache_path}: {e}")
+
+        return symbol_to_asset_id
+
+    async def get_intraday_data_after_time(self, asset_id: str, rec_timestamp: datetime,
+                                           max_bars: Optional[int] = None, now_ms: Optional[int] = None) -> List[Dict]:
+        """
+        Fetches the 5-minute candle data for the rest of the day after a recommendation,
+        limited to at most `max_bars` candles when given. `now_ms` lets callers share a
+        single end timestamp across many fetches.
+        """
         from_timestamp = int(rec_timestamp.timestamp() * 1000)
-        to_timestamp = int(now.timestamp() * 1000)
+        to_timestamp = now_ms if now_ms is not None else int(datetime.now().timestamp() * 1000)
+        if max_bars:
+            to_timestamp = min(to_timestamp, from_timestamp + max_bars * FIVE_MINUTES_MS)
 
         url = f"https://prod.thndr.app/assets-service/charts/advanced?asset_id={asset_id}&resolution=five_minutes&from_timestamp={from_timestamp}&to_timestamp={to_timestamp}"
-        data = await self.market_data_service.fetch_json(session, url, config['api_settings']['headers'])
+        data = await self.market_data_service.fetch_json(url, config['api_settings']['headers'])
 
         return data.get("points", []) if data else []
         
+    async def _fetch_and_resolve(self, rec: Dict, asset_id: str,
+                                 max_bars: Optional[int], now_ms: int) -> Optional[Tuple[str, float]]:
+        """
+        Fetches the candles for one recommendation and resolves its outcome, returning
+        only (status, pnl) so the candle list can be freed right away.
+        """
+        symbol = rec['symbol']
+        intraday_candles = await self.get_intraday_data_after_time(asset_id, rec['timestamp'], max_bars, now_ms)
+
+        if not intraday_candles:
+            self.logger.warning(f"Could not fetch post-recommendation data for {symbol}. Skipping.")
+            return None
+
+        # The query always selects these columns, so subscript instead of .get()
+        target_price = rec['target']
+        stop_loss_price = rec['stop_loss']
+        buy_price = rec['buy_price']
+
+        count = len(intraday_candles)
+        lows = np.fromiter((c.get('low', 0) for c in intraday_candles), dtype=np.float64, count=count)
+        highs = np.fromiter((c.get('high', 0) for c in intraday_candles), dtype=np.float64, count=count)
+
+        status, pnl = resolve_trade(lows, highs, buy_price, target_price, stop_loss_price)
+
+        # print("-" * 50)
+        # print(f"Symbol: {symbol} ({rec['signal_type']})")
+        # print(f"  - Recommendation Time: {rec['timestamp'].strftime('%H:%M:%S')}")
+        # print(f"  - Entry: {buy_price:.2f} | Target: {target_price:.2f} | Stop: {stop_loss_price:.2f}")
+        # print(f"  - Status: {status}")
+        # if status in ["WIN", "LOSS"]:
+        #     print(f"  - P/L: {pnl:.2f} EGP")
+
+        return status, pnl
+
     async def analyze(self):
         """Main function to run the performance analysis."""
         self.logger.info("Starting performance analysis for today's recommendations...")
@@ -96,67 +211,41 @@ class PerformanceAnalyzer:
         total_gain = 0.0
         total_loss = 0.0
         
-        async with aiohttp.ClientSession() as session:
-            all_assets = await self.market_data_service.fetch_market_data(session, config['api_settings']['headers'])
-            symbol_to_asset_id = {asset['symbol']: asset['asset_id'] for asset in all_assets if 'symbol' in asset and 'asset_id' in asset}
-
-            for rec in recommendations:
-                symbol = rec['symbol']
-                asset_id = symbol_to_asset_id.get(symbol)
-                
-                if not asset_id:
-                    self.logger.warning(f"Could not find asset_id for {symbol}. Skipping.")
-                    continue
-
-                intraday_candles = await self.get_intraday_data_after_time(session, asset_id, rec['timestamp'])
-                
-                if not intraday_candles:
-                    self.logger.warning(f"Could not fetch post-recommendation data for {symbol}. Skipping.")
-                    continue
-
-                target_price = rec.get('target')
-                stop_loss_price = rec.get('stop_loss')
-                buy_price = rec.get('buy_price')
-                
-                status = "PENDING"
-                pnl = 0.0
-                trade_entered = False
-
-                for candle in intraday_candles:
-                    candle_low = candle.get('low', 0)
-                    candle_high = candle.get('high', 0)
-
-                    # Step 1: Check if the trade has been entered
-                    if not trade_entered and buy_price and candle_low <= buy_price <= candle_high:
-                        trade_entered = True
-                        status = "ENTERED"
-                        # Once entered, we check for win/loss in the *same* candle
-                    
-                    # Step 2: If trade is live, check for win or loss
-                    if trade_entered:
-                        # Check for WIN: Did the price hit the target?
-                        if target_price and candle_high >= target_price:
-                            status = "WIN"
-                            pnl = target_price - buy_price
-                            total_wins += 1
-                            total_gain += pnl
-                            break # Exit loop once trade is resolved
-
-                        # Check for LOSS: Did the price hit the stop-loss?
-                        if stop_loss_price and candle_low <= stop_loss_price:
-                            status = "LOSS"
-                            pnl = buy_price - stop_loss_price # Loss is positive for calculation
-                            total_losses += 1
-                            total_loss += pnl
-                            break # Exit loop once trade is resolved
-                
-                # print("-" * 50)
-                # print(f"Symbol: {symbol} ({rec['signal_type']})")
-                # print(f"  - Recommendation Time: {rec['timestamp'].strftime('%H:%M:%S')}")
-                # print(f"  - Entry: {buy_price:.2f} | Target: {target_price:.2f} | Stop: {stop_loss_price:.2f}")
-                # print(f"  - Status: {status}")
-                # if status in ["WIN", "LOSS"]:
-                #     print(f"  - P/L: {pnl:.2f} EGP")
+        symbol_to_asset_id = await self.get_symbol_to_asset_id()
+        max_bars = config.get('analysis_max_bars_per_trade')
+        # One end timestamp for every fetch; drift within a run is irrelevant at 5-minute resolution
+        now_ms = int(datetime.now().timestamp() * 1000)
+
+        resolvable_recs = []
+        for rec in recommendations:
+            if symbol_to_asset_id.get(rec['symbol']):
+                resolvable_recs.append(rec)
+            else:
+                self.logger.warning(f"Could not find asset_id for {rec['symbol']}. Skipping.")
+
+        # Resolve each trade as soon as its candles arrive so the simulation overlaps with
+        # still-pending fetches; the rate limiter inside fetch_json caps in-flight requests.
+        tasks = [
+            asyncio.create_task(self._fetch_and_resolve(rec, symbol_to_asset_id[rec['symbol']], max_bars, now_ms))
+            for rec in resolvable_recs
+        ]
+        for next_result in asyncio.as_completed(tasks):
+            try:
+                result = await next_result
+            except Exception as e:
+                self.logger.warning(f"Could not analyze a recommendation: {e}")
+                continue
+
+            if result is None:
+                continue
+
+            status, pnl = result
+            if status == "WIN":
+                total_wins += 1
+                total_gain += pnl
+            elif status == "LOSS":
+                total_losses += 1
+                total_loss += pnl
         
         # --- Final Summary ---
         net_profit = total_gain - total_loss
@@ -173,10 +262,18 @@ class PerformanceAnalyzer:
         print("="*50)
 
 
+async def main():
+    analyzer = PerformanceAnalyzer()
+    try:
+        await analyzer.analyze()
+    finally:
+        await analyzer.aclose()
+
+
 if __name__ == "__main__":
     try:
-        analyzer = PerformanceAnalyzer()
-        asyncio.run(analyzer.analyze())
+        install_uvloop()
+        asyncio.run(main())
     except Exception as e:
         logging.critical(f"A critical error occurred: {e}")
         sys.exit(1)
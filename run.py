@@ -8,6 +8,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.main import TradingApp
 from src.utils.config import load_config
+from src.utils.event_loop import install_uvloop
 from src.database.postgres import engine, Base # Import engine and Base
 from src.database.models import SignalHistory, Subscriber # Import models to ensure they are registered with Base
 
@@ -23,6 +24,8 @@ if __name__ == "__main__":
     Base.metadata.create_all(bind=engine)
     logging.info("Database tables checked/created.")
 
+    # Set the event loop policy before any asyncio objects are created
+    install_uvloop()
     app = TradingApp(config)
     asyncio.run(app.run())
         
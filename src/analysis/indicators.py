@@ -0,0 +1,226 @@
+import numpy as np
+from typing import Tuple
+
+# Last-value implementations of the `ta` indicators used by the strategy.
+# Each function mirrors the corresponding `ta` default (windows, smoothing,
+# warm-up) but only computes what is needed for the final bar, and returns
+# NaN wherever `ta` would produce NaN or fail for lack of data.
+
+NAN = float('nan')
+
+
+def _ewm_adjust_false(values: np.ndarray, alpha: float) -> np.ndarray:
+    """Recursive EWM equivalent to pandas' ewm(alpha=..., adjust=False)."""
+    out = np.empty(len(values))
+    if not len(values):
+        return out
+    decay = 1.0 - alpha
+    prev = values[0]
+    out[0] = prev
+    for i, value in enumerate(values[1:].tolist(), 1):
+        prev = decay * prev + alpha * value
+        out[i] = prev
+    return out
+
+
+def _wilder_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Wilder running sum seeded with the first `window` values, as in ta's ADX."""
+    out = np.empty(len(values) - window + 1)
+    prev = float(values[:window].sum())
+    out[0] = prev
+    for i, value in enumerate(values[window:].tolist(), 1):
+        prev = prev - prev / window + value
+        out[i] = prev
+    return out
+
+
+def rsi_last(close: np.ndarray, window: int = 14) -> float:
+    """
+    Relative Strength Index of the final bar.
+
+    Args:
+        close: Close prices, oldest first
+        window: Lookback period
+
+    Returns:
+        RSI value or NaN if insufficient data
+    """
+    if len(close) < window:
+        return NAN
+    diff = np.diff(close, prepend=close[0])
+    emaup = _ewm_adjust_false(np.where(diff > 0, diff, 0.0), 1.0 / window)[-1]
+    emadn = _ewm_adjust_false(np.where(diff < 0, -diff, 0.0), 1.0 / window)[-1]
+    if emadn == 0:
+        return 100.0
+    return 100.0 - (100.0 / (1.0 + emaup / emadn))
+
+
+def stoch_last(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+               window: int = 14, smooth_window: int = 3) -> Tuple[float, float]:
+    """
+    Stochastic oscillator %K and its %D signal for the final bar.
+
+    Returns:
+        Tuple of (stoch_k, stoch_d), NaN where unavailable
+    """
+    n = len(close)
+    if n < window:
+        return NAN, NAN
+    count = min(smooth_window, n - window + 1)
+    k = np.empty(count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j in range(count):
+            end = n - count + j + 1
+            smin = low[end - window:end].min()
+            smax = high[end - window:end].max()
+            k[j] = 100 * (close[end - 1] - smin) / (smax - smin)
+    stoch_d = float(k.mean()) if count == smooth_window else NAN
+    return float(k[-1]), stoch_d
+
+
+def macd_last(close: np.ndarray, window_fast: int = 12, window_slow: int = 26,
+              window_sign: int = 9) -> Tuple[float, float, float]:
+    """
+    MACD line, signal line and histogram for the final bar.
+
+    Returns:
+        Tuple of (macd, macd_signal, macd_hist), NaN where unavailable
+    """
+    if len(close) < window_slow:
+        return NAN, NAN, NAN
+    ema_fast = _ewm_adjust_false(close, 2.0 / (window_fast + 1))
+    ema_slow = _ewm_adjust_false(close, 2.0 / (window_slow + 1))
+    # The MACD line only exists once the slow EMA is warmed up; the signal
+    # EMA starts from the first valid MACD value
+    macd_line = (ema_fast - ema_slow)[window_slow - 1:]
+    macd = float(macd_line[-1])
+    if len(macd_line) < window_sign:
+        return macd, NAN, NAN
+    signal = float(_ewm_adjust_false(macd_line, 2.0 / (window_sign + 1))[-1])
+    return macd, signal, macd - signal
+
+
+def adx_last(high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int = 14) -> float:
+    """
+    Average Directional Index of the final bar, following ta's Wilder smoothing.
+
+    Returns:
+        ADX value or NaN if insufficient data
+    """
+    n = len(close)
+    if n < 2 * window:
+        return NAN
+
+    prev_close = close[:-1]
+    high_1, low_1 = high[1:], low[1:]
+    true_range = np.maximum(high_1, prev_close) - np.minimum(low_1, prev_close)
+    diff_up = high_1 - high[:-1]
+    diff_down = low[:-1] - low_1
+    pos = np.where((diff_up > diff_down) & (diff_up > 0), diff_up, 0.0)
+    neg = np.where((diff_down > diff_up) & (diff_down > 0), diff_down, 0.0)
+
+    # ta leaves a trailing zero slot in its smoothed series that never feeds
+    # the last ADX value, so it is simply not computed here
+    trs = _wilder_sum(true_range, window)
+    dip = _wilder_sum(pos, window)
+    din = _wilder_sum(neg, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        di_pos = np.where(trs != 0, 100 * dip / trs, 0.0)
+        di_neg = np.where(trs != 0, 100 * din / trs, 0.0)
+        di_sum = di_pos + di_neg
+        dx = np.where(di_sum != 0, 100 * np.abs((di_pos - di_neg) / di_sum), 0.0)
+
+    adx = float(dx[:window].mean())
+    for value in dx[window:].tolist():
+        adx = (adx * (window - 1) + value) / float(window)
+    return adx
+
+
+def atr_last(high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int = 14) -> float:
+    """
+    Average True Range of the final bar with Wilder smoothing.
+
+    Returns:
+        ATR value or NaN if insufficient data
+    """
+    if len(close) < window:
+        return NAN
+    true_range = np.empty(len(close))
+    true_range[0] = high[0] - low[0]
+    prev_close = close[:-1]
+    true_range[1:] = np.maximum.reduce([
+        high[1:] - low[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)
+    ])
+    atr = float(true_range[:window].mean())
+    for value in true_range[window:].tolist():
+        atr = (atr * (window - 1) + value) / float(window)
+    return atr
+
+
+def bollinger_last(close: np.ndarray, window: int = 20, window_dev: int = 2) -> Tuple[float, float, float]:
+    """
+    Bollinger Bands for the final bar.
+
+    Returns:
+        Tuple of (upper, middle, lower) bands, NaN if insufficient data
+    """
+    if len(close) < window:
+        return NAN, NAN, NAN
+    recent = close[-window:]
+    mid = float(recent.mean())
+    std = float(recent.std())
+    return mid + window_dev * std, mid, mid - window_dev * std
+
+
+def mfi_last(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+             volume: np.ndarray, window: int = 14) -> float:
+    """
+    Money Flow Index of the final bar.
+
+    Returns:
+        MFI value or NaN if unavailable
+    """
+    if len(close) < window:
+        return NAN
+    typical_price = (high + low + close) / 3.0
+    up_down = np.zeros(len(typical_price))
+    up_down[1:] = np.sign(typical_price[1:] - typical_price[:-1])
+    money_flow = (typical_price * volume * up_down)[-window:]
+    positive = money_flow[money_flow >= 0.0].sum()
+    negative = abs(money_flow[money_flow < 0.0].sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.float64(positive) / negative
+        return float(100 - (100 / (1 + ratio)))
+
+
+def vwap_last(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+              volume: np.ndarray, window: int = 14) -> float:
+    """
+    Rolling volume weighted average price of the final bar.
+
+    Returns:
+        VWAP value or NaN if unavailable
+    """
+    if len(close) < window:
+        return NAN
+    typical_price = (high[-window:] + low[-window:] + close[-window:]) / 3.0
+    recent_volume = volume[-window:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64((typical_price * recent_volume).sum()) / recent_volume.sum())
+
+
+def sma_last(values: np.ndarray, window: int) -> float:
+    """Simple moving average of the last `window` values, NaN if insufficient data."""
+    if len(values) < window:
+        return NAN
+    return float(values[-window:].mean())
+
+
+def ema_last(values: np.ndarray, span: int) -> float:
+    """Exponential moving average of the final value, matching pandas' ewm(span=...) with adjust=True."""
+    if not len(values):
+        return NAN
+    alpha = 2.0 / (span + 1)
+    weights = (1.0 - alpha) ** np.arange(len(values) - 1, -1, -1)
+    return float(np.dot(weights, values) / weights.sum())
@@ -1,123 +1,230 @@
-from typing import Dict, Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
-import pandas as pd
+import os
+import threading
+
+from .technical import calculate_technical_indicators
+from .trade_flow import analyze_trade_flow
+
+TECH_CACHE_MAX_ENTRIES = 4096
+
 
 class SignalGenerator:
+    # Max possible score: 8 (technical) + 2 (flow) + 2 (depth)
+    MAX_SCORE = 8 + 2 + 2
+
     def __init__(self, config: Dict):
         self.config = config
+        self.logger = logging.getLogger(__name__)
         self.strategy_config = config['strategy']
         self.tech_thresholds = self.strategy_config.get('technical_thresholds', {})
         self.flow_thresholds = self.strategy_config.get('trade_flow_thresholds', {})
 
+        # Scoring thresholds are resolved once here rather than on every analysis
+        self.adx_trend_threshold = self.tech_thresholds.get('adx_trend_threshold', 25)
+        self.macd_signal_threshold = self.tech_thresholds.get('macd_signal_threshold', 0)
+        self.rsi_overbought = self.tech_thresholds.get('rsi_overbought', 70)
+        self.strong_buy_pressure = self.flow_thresholds.get('strong_buy_pressure', 0.65)
+        self.high_institutional_ratio = self.flow_thresholds.get('high_institutional_ratio', 0.60)
+        self.max_spread_pct = self.strategy_config.get('max_spread_pct', 0.02)
+        self.debug_mode = self.strategy_config.get('debug_mode', False)
+
+        # Signal type gates; STRONG_BUY needs one point above the combined minimums
+        self.min_tech_score = self.strategy_config.get('min_tech_conditions', 6)  # Now a score, not a count
+        self.min_flow_score = self.strategy_config.get('min_flow_conditions', 2)
+        self.min_depth_score = self.strategy_config.get('min_depth_conditions', 1)
+        self.strong_buy_threshold = self.min_tech_score + self.min_flow_score + self.min_depth_score + 1
+
+        # Risk sizing parameters
+        self.stop_loss_atr_multiplier = self.strategy_config.get('stop_loss_atr_multiplier', 1.5)
+        self.structural_stop_lookback = self.strategy_config.get('structural_stop_lookback', 5)
+        self.min_daily_volume = self.strategy_config.get('min_daily_volume', 100000)
+        self.max_position_size = self.strategy_config.get('max_position_size', 100000)
+
+        # Indicator and trade-flow work is CPU bound, so it runs off the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get('analysis_workers') or os.cpu_count(),
+            thread_name_prefix='signal-generator'
+        )
+
+        # Indicators only change when the candle window does; analyses run on
+        # several threads, so the LRU is guarded by a lock
+        self._tech_cache: OrderedDict = OrderedDict()
+        self._tech_cache_lock = threading.Lock()
+
     async def analyze_stock(self, stock: Dict, historical_data: List[Dict],
                           market_depth: Dict, trades_data: Dict) -> Optional[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._analyze_sync, stock, historical_data, market_depth, trades_data
+        )
+
+    async def analyze_stocks_batch(self, stocks: List[Dict], hist_map: Dict[str, List[Dict]],
+                                   depth_map: Dict[str, Dict], trades_map: Dict[str, Dict]) -> List[Optional[Dict]]:
+        """Analyze several stocks concurrently, keyed by symbol in each map."""
+        return await asyncio.gather(*(
+            self.analyze_stock(
+                stock,
+                hist_map.get(stock.get('symbol'), []),
+                depth_map.get(stock.get('symbol'), {}),
+                trades_map.get(stock.get('symbol'), {})
+            )
+            for stock in stocks
+        ))
+
+    def _analyze_sync(self, stock: Dict, historical_data: List[Dict],
+                      market_depth: Dict, trades_data: Dict) -> Optional[Dict]:
         try:
-            from .technical import calculate_technical_indicators
-            technical_indicators = calculate_technical_indicators(historical_data)
+            technical_indicators = self._get_technical_indicators(stock.get('symbol'), historical_data)
 
             if not technical_indicators:
                 return self._create_empty_analysis(stock.get('symbol'))
 
-            from .trade_flow import analyze_trade_flow
+            # Most stocks fail the technical gate; skip trade flow, the remaining scoring and risk work for them
+            tech_score = self._score_technical_indicators(technical_indicators)
+            if tech_score < self.min_tech_score:
+                return self._create_neutral_signal(stock, technical_indicators, tech_score)
+
             trade_flow = analyze_trade_flow(trades_data, self.config)
 
-            return self._generate_signal(stock, technical_indicators, trade_flow, market_depth, historical_data)
-        except Exception as e:
-            print(f"Error analyzing stock {stock.get('symbol')}: {e}")
+            return self._generate_signal(stock, technical_indicators, trade_flow, market_depth, historical_data, tech_score)
+        except (KeyError, ValueError, TypeError, ZeroDivisionError) as e:
+            self.logger.warning("Error analyzing stock %s: %s", stock.get('symbol'), e)
             return None
 
-    def _generate_signal(self, stock: Dict, technical: Dict, trade_flow: Dict, market_depth: Dict, historical_data: List[Dict]) -> Dict:
-        self.stock_symbol_for_logging = stock.get('symbol', 'UNKNOWN')
-        
-        scores = self._calculate_component_scores(technical, trade_flow, market_depth)
-        signal_type, total_score = self._determine_signal_type(scores) # Modified
+    @staticmethod
+    def _tech_cache_key(symbol: Optional[str], historical_data: List[Dict]) -> Optional[Tuple[Any, ...]]:
+        if not historical_data:
+            return None
+        first, last = historical_data[0], historical_data[-1]
+        # The live candle keeps updating, so its values are part of the key
+        return (
+            symbol, len(historical_data), first.get('time'), last.get('time'),
+            last.get('close'), last.get('high'), last.get('low'), last.get('volume')
+        )
+
+    def _get_technical_indicators(self, symbol: Optional[str], historical_data: List[Dict]) -> Optional[Dict]:
+        key = self._tech_cache_key(symbol, historical_data)
+        if key is None:
+            return calculate_technical_indicators(historical_data)
+
+        with self._tech_cache_lock:
+            if key in self._tech_cache:
+                self._tech_cache.move_to_end(key)
+                return self._tech_cache[key]
+
+        technical_indicators = calculate_technical_indicators(historical_data)
+
+        with self._tech_cache_lock:
+            self._tech_cache[key] = technical_indicators
+            self._tech_cache.move_to_end(key)
+            while len(self._tech_cache) > TECH_CACHE_MAX_ENTRIES:
+                self._tech_cache.popitem(last=False)
+        return technical_indicators
+
+    def _generate_signal(self, stock: Dict, technical: Dict, trade_flow: Dict, market_depth: Dict,
+                         historical_data: List[Dict], tech_score: Optional[int] = None) -> Dict:
+        symbol = stock.get('symbol')
+        price = stock.get('last_trade_price', 0)
+
+        tech_score, flow_score, depth_score = self._calculate_component_scores(
+            technical, trade_flow, market_depth, tech_score
+        )
+        signal_type, total_score = self._determine_signal_type(
+            tech_score, flow_score, depth_score, symbol or 'UNKNOWN'
+        ) # Modified
         signal_strength = self._calculate_signal_strength(total_score) # Modified
 
         signal = {
-            'symbol': stock.get('symbol'),
+            'symbol': symbol,
             'timestamp': stock.get('last_update_time'),
-            'price': stock.get('last_trade_price'),
+            'price': price,
             'signal_type': signal_type,
             'signal_strength': round(signal_strength, 4), 
-            'component_scores': scores,
+            'component_scores': {
+                'technical': tech_score,
+                'trade_flow': flow_score,
+                'market_depth': depth_score
+            },
             'technical_indicators': technical,
             'trade_flow_metrics': trade_flow,
-            'risk_metrics': self._calculate_risk_metrics(stock, technical, market_depth, historical_data),
+            'market_depth_metrics': market_depth,
+            'risk_metrics': self._calculate_risk_metrics(stock, price, technical, market_depth, historical_data),
             'stock_details': stock
         }
         return signal
         
-    def _calculate_component_scores(self, technical: Dict, trade_flow: Dict, market_depth: Dict) -> Dict:
-        return {
-            'technical': self._score_technical_indicators(technical),
-            'trade_flow': self._score_trade_flow(trade_flow),
-            'market_depth': self._score_market_depth(market_depth, technical.get('close', 0))
-        }
+    def _calculate_component_scores(self, technical: Dict, trade_flow: Dict, market_depth: Dict,
+                                    tech_score: Optional[int] = None) -> Tuple[int, int, int]:
+        return (
+            self._score_technical_indicators(technical) if tech_score is None else tech_score,
+            self._score_trade_flow(trade_flow),
+            self._score_market_depth(market_depth, technical.get('close', 0))
+        )
 
     def _score_technical_indicators(self, indicators: Dict) -> int:
-        def get_value(key, default=0):
-            val = indicators.get(key)
-            return default if val is None else val
+        # Read each indicator once; missing values score as 0 (RSI as neutral 50)
+        get = indicators.get
+        adx = get('adx') or 0
+        macd = get('macd') or 0
+        macd_signal = get('macd_signal') or 0
+        macd_hist = get('macd_hist') or 0
+        stoch_k = get('stoch_k') or 0
+        stoch_d = get('stoch_d') or 0
+        close = get('close') or 0
+        bb_mid = get('bb_mid') or 0
+        sma_20 = get('sma_20') or 0
+        rsi = get('rsi')
+        if rsi is None:
+            rsi = 50
 
-        score = 0
-        
-        # --- High Importance Conditions (Score: 2) ---
-        # Strong trend is active
-        if get_value('adx') > self.tech_thresholds.get('adx_trend_threshold', 25):
-            score += 2
-        # MACD is in a bullish posture (above signal line AND histogram is positive)
-        if get_value('macd') > get_value('macd_signal') and get_value('macd_hist') > self.tech_thresholds.get('macd_signal_threshold', 0):
-            score += 2
-        
-        # --- Medium Importance Conditions (Score: 1) ---
-        # RSI is not overbought
-        if get_value('rsi', 50) < self.tech_thresholds.get('rsi_overbought', 70):
-            score += 1
-        # Stochastic is in a bullish posture
-        if get_value('stoch_k') > get_value('stoch_d'):
-            score += 1
-        # Price is above the mid-Bollinger Band
-        if get_value('close') > get_value('bb_mid'):
-            score += 1
-        # Price is above the 20-period SMA
-        if get_value('close') > get_value('sma_20'):
-            score += 1
-        
-        return score
+        # Booleans add as 0/1, weighted by importance
+        return (
+            # --- High Importance Conditions (Score: 2) ---
+            # Strong trend is active
+            2 * (adx > self.adx_trend_threshold)
+            # MACD is in a bullish posture (above signal line AND histogram is positive)
+            + 2 * (macd > macd_signal and macd_hist > self.macd_signal_threshold)
+            # --- Medium Importance Conditions (Score: 1) ---
+            # RSI is not overbought
+            + (rsi < self.rsi_overbought)
+            # Stochastic is in a bullish posture
+            + (stoch_k > stoch_d)
+            # Price is above the mid-Bollinger Band
+            + (close > bb_mid)
+            # Price is above the 20-period SMA
+            + (close > sma_20)
+        )
 
     def _score_trade_flow(self, trade_flow: Dict) -> int:
-        score = 0
-        if trade_flow.get('buy_pressure', 0) > self.flow_thresholds.get('strong_buy_pressure', 0.65):
-            score += 1
-        if trade_flow.get('institutional_ratio', 0) > self.flow_thresholds.get('high_institutional_ratio', 0.60):
-            score += 1
-        return score
+        return (
+            (trade_flow.get('buy_pressure', 0) > self.strong_buy_pressure)
+            + (trade_flow.get('institutional_ratio', 0) > self.high_institutional_ratio)
+        )
 
     def _score_market_depth(self, depth: Dict, current_price: float) -> int:
-        score = 0
         bids_vol = depth.get('bids_vol', 0)
         asks_vol = depth.get('asks_vol', 0)
         spread = depth.get('spread', float('inf'))
 
-        if asks_vol == 0 or current_price == 0:
+        if asks_vol <= 0 or current_price <= 0:
             return 0
 
-        if bids_vol > asks_vol * 1.2: # Require bids to be 20% stronger than asks
-            score += 1
-        if (spread / current_price) < self.strategy_config.get('max_spread_pct', 0.02):
-            score += 1
-        return score
+        return (
+            (bids_vol > asks_vol * 1.2)  # Require bids to be 20% stronger than asks
+            + (spread < current_price * self.max_spread_pct)
+        )
 
-    def _determine_signal_type(self, scores: Dict) -> Tuple[str, int]:
-        tech_score = scores.get('technical', 0)
-        flow_score = scores.get('trade_flow', 0)
-        depth_score = scores.get('market_depth', 0)
+    def _determine_signal_type(self, tech_score: int, flow_score: int, depth_score: int,
+                               symbol: str = 'UNKNOWN') -> Tuple[str, int]:
         total_score = tech_score + flow_score + depth_score
         
-        # Define thresholds based on the new weighted scoring
-        min_tech_score = self.strategy_config.get('min_tech_conditions', 6) # Now a score, not a count
-        min_flow_score = self.strategy_config.get('min_flow_conditions', 2)
-        min_depth_score = self.strategy_config.get('min_depth_conditions', 1)
+        min_tech_score = self.min_tech_score
+        min_flow_score = self.min_flow_score
+        min_depth_score = self.min_depth_score
 
         is_buy = (
             tech_score >= min_tech_score and
@@ -126,50 +233,40 @@ class SignalGenerator:
         )
         
         # --- DEBUG LOGGING ---
-        if self.strategy_config.get('debug_mode', False):
-            logging.info(
-                f"[DEBUG] Symbol: {self.stock_symbol_for_logging} | "
-                f"Tech: {tech_score}/{min_tech_score} | "
-                f"Flow: {flow_score}/{min_flow_score} | "
-                f"Depth: {depth_score}/{min_depth_score} | "
-                f"Signal: {'BUY' if is_buy else 'NEUTRAL'}"
+        if self.debug_mode and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "[DEBUG] Symbol: %s | Tech: %s/%s | Flow: %s/%s | Depth: %s/%s | Signal: %s",
+                symbol, tech_score, min_tech_score, flow_score, min_flow_score,
+                depth_score, min_depth_score, 'BUY' if is_buy else 'NEUTRAL'
             )
 
         if is_buy:
-            strong_buy_threshold = min_tech_score + min_flow_score + min_depth_score + 1
-            if total_score >= strong_buy_threshold:
+            if total_score >= self.strong_buy_threshold:
                 return 'STRONG_BUY', total_score
             return 'BUY', total_score
 
         return 'NEUTRAL', total_score
    
     def _calculate_signal_strength(self, current_score: int) -> float:
-        # Max possible score: 8 (technical) + 2 (flow) + 2 (depth) = 12
-        max_possible_score = 8 + 2 + 2 
-        return current_score / max_possible_score if max_possible_score > 0 else 0
+        return current_score / self.MAX_SCORE
 
-    def _calculate_risk_metrics(self, stock: Dict, technical: Dict,
+    def _calculate_risk_metrics(self, stock: Dict, price: float, technical: Dict,
                               market_depth: Dict, historical_data: List[Dict]) -> Dict:
-        price = stock.get('last_trade_price', 0)
         atr = technical.get('atr', 0)
         
-        stop_loss_atr_multiplier = self.strategy_config.get('stop_loss_atr_multiplier', 1.5)
-        take_profit_multiplier = self.strategy_config.get('take_profit_atr_multiplier', 3.0)
-        
         if atr <= 0 or price <= 0:
             return {'stop_loss': 0, 'take_profit': 0, 'adjusted_buy_price': price}
 
         # --- Refined Stop-Loss Logic ---
         # Method 1: ATR-based stop
-        atr_stop = price - (atr * stop_loss_atr_multiplier)
+        atr_stop = price - (atr * self.stop_loss_atr_multiplier)
         
         # Method 2: Structural stop based on recent lows
         structural_stop = 0
-        lookback_period = self.strategy_config.get('structural_stop_lookback', 5)
+        lookback_period = self.structural_stop_lookback
         if historical_data and len(historical_data) >= lookback_period:
             try:
-                recent_lows = [p['low'] for p in historical_data[-lookback_period:]]
-                structural_stop = min(recent_lows) * 0.99 # Place stop just below the lowest low
+                structural_stop = min(p['low'] for p in historical_data[-lookback_period:]) * 0.99 # Place stop just below the lowest low
             except (KeyError, IndexError):
                 structural_stop = 0
         
@@ -192,7 +289,7 @@ class SignalGenerator:
         return {
             'volatility': round(atr, 4),
             'liquidity_risk': self._calculate_liquidity_risk(market_depth),
-            'position_size': self._calculate_position_size(stock),
+            'position_size': self._calculate_position_size(stock, price),
             'stop_loss': round(stop_loss, 3),
             'take_profit': round(take_profit, 3),
             'adjusted_buy_price': round(adjusted_buy_price, 3)
@@ -203,11 +300,10 @@ class SignalGenerator:
         asks_vol = depth.get('asks_vol', 0)
         total_volume = bids_vol + asks_vol
         
-        min_volume = self.strategy_config.get('min_daily_volume', 100000)
+        min_volume = self.min_daily_volume
         return max(0, 1 - min(total_volume / min_volume, 1)) if min_volume > 0 else 1
 
-    def _calculate_position_size(self, stock: Dict) -> float:
-        price = stock.get('last_trade_price', 0)
+    def _calculate_position_size(self, stock: Dict, price: float) -> float:
         if not price or price <= 0:
             return 0
             
@@ -217,7 +313,7 @@ class SignalGenerator:
             return 0
         
         max_position = min(
-            self.strategy_config.get('max_position_size', 100000),
+            self.max_position_size,
             daily_volume * price * 0.1
         )
         return max(max_position, 0)
@@ -227,9 +323,30 @@ class SignalGenerator:
         multiplier = self.strategy_config.get('stop_loss_atr_multiplier', 2)
         return atr * multiplier if atr else 0
 
+    def _create_neutral_signal(self, stock: Dict, technical: Dict, tech_score: int) -> Dict:
+        symbol = stock.get('symbol')
+        if self.debug_mode and self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "[DEBUG] Symbol: %s | Tech: %s/%s | Signal: NEUTRAL",
+                symbol or 'UNKNOWN', tech_score, self.min_tech_score
+            )
+        return {
+            'symbol': symbol,
+            'timestamp': stock.get('last_update_time'),
+            'price': stock.get('last_trade_price', 0),
+            'signal_type': 'NEUTRAL',
+            'signal_strength': round(self._calculate_signal_strength(tech_score), 4),
+            'component_scores': {'technical': tech_score},
+            'technical_indicators': technical,
+            'trade_flow_metrics': {},
+            'market_depth_metrics': {},
+            'risk_metrics': {},
+            'stock_details': stock
+        }
+
     def _create_empty_analysis(self, symbol: Optional[str]) -> Dict:
         return {
             'symbol': symbol, 'timestamp': None, 'price': 0, 'signal_type': 'NEUTRAL',
             'signal_strength': 0, 'component_scores': {}, 'technical_indicators': {},
-            'trade_flow_metrics': {}, 'risk_metrics': {},
+            'trade_flow_metrics': {}, 'market_depth_metrics': {}, 'risk_metrics': {},
         }
\ No newline at end of file
@@ -1,8 +1,34 @@
+import math
 import pandas as pd
-import ta
 import numpy as np
 from typing import Dict, Optional, List
 
+from .indicators import (
+    adx_last, atr_last, bollinger_last, ema_last, macd_last,
+    mfi_last, rsi_last, sma_last, stoch_last, vwap_last
+)
+
+REQUIRED_COLUMNS = {
+    'close': ('close', 'Close', 'CLOSE'),
+    'high': ('high', 'High', 'HIGH'),
+    'low': ('low', 'Low', 'LOW'),
+    'volume': ('volume', 'Volume', 'VOLUME', 'vol')
+}
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _time_order(times: List) -> np.ndarray:
+    """Stable sort order for candle times; unparseable times sort last."""
+    try:
+        return np.argsort(np.array(times, dtype=np.float64), kind='stable')
+    except (TypeError, ValueError):
+        parsed = pd.to_datetime(pd.Series(times), errors='coerce').to_numpy(dtype='datetime64[ns]')
+        return np.argsort(parsed, kind='stable')
+
 def calculate_technical_indicators(history: List[Dict]) -> Optional[Dict]:
     """
     Calculate comprehensive technical indicators from historical data.
@@ -17,157 +43,79 @@ def calculate_technical_indicators(history: List[Dict]) -> Optional[Dict]:
         return None
     
     try:
-        # Convert to DataFrame
-        df = pd.DataFrame(history)
-        
         # Ensure required columns exist and handle different naming conventions
-        required_mapping = {
-            'close': ['close', 'Close', 'CLOSE'],
-            'high': ['high', 'High', 'HIGH'],
-            'low': ['low', 'Low', 'LOW'],
-            'volume': ['volume', 'Volume', 'VOLUME', 'vol']
-        }
-        
-        # Map columns to standard names
-        for standard_name, possible_names in required_mapping.items():
-            found = False
-            for possible_name in possible_names:
-                if possible_name in df.columns:
-                    if standard_name != possible_name:
-                        df[standard_name] = df[possible_name]
-                    found = True
-                    break
-            if not found:
+        columns = set().union(*history)
+        field_names = {}
+        for standard_name, possible_names in REQUIRED_COLUMNS.items():
+            field_names[standard_name] = next((name for name in possible_names if name in columns), None)
+            if field_names[standard_name] is None:
                 print(f"Missing required column: {standard_name}")
                 return None
-        
-        # Convert to numeric and handle missing values
-        numeric_columns = ['close', 'high', 'low', 'volume']
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
+
+        # Pull the OHLCV columns straight into float arrays; unparseable values become NaN
+        size = len(history)
+        close = np.empty(size)
+        high = np.empty(size)
+        low = np.empty(size)
+        volume = np.empty(size)
+        close_key, high_key = field_names['close'], field_names['high']
+        low_key, volume_key = field_names['low'], field_names['volume']
+        for i, row in enumerate(history):
+            close[i] = _to_float(row.get(close_key))
+            high[i] = _to_float(row.get(high_key))
+            low[i] = _to_float(row.get(low_key))
+            volume[i] = _to_float(row.get(volume_key))
+
         # Remove rows with NaN values
-        df = df.dropna(subset=numeric_columns)
-        
-        if len(df) < 26:
+        valid = ~(np.isnan(close) | np.isnan(high) | np.isnan(low) | np.isnan(volume))
+        if valid.sum() < 26:
             return None
-        
+
         # Sort by date if available
-        if 'time' in df.columns:
-            date_col = 'time'
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-            df = df.sort_values(date_col)
-        
-        # Calculate technical indicators with error handling
+        order = np.flatnonzero(valid)
+        if 'time' in columns:
+            order = order[_time_order([history[i].get('time') for i in order])]
+        close, high, low, volume = close[order], high[order], low[order], volume[order]
+
+        # Only the last value of each indicator is used, so compute just that
         indicators = {}
         
         # Momentum Indicators
-        try:
-            indicators['rsi'] = ta.momentum.rsi(df['close'], window=14).iloc[-1]
-        except:
-            indicators['rsi'] = None
-            
-        try:
-            indicators['rsi_fast'] = ta.momentum.rsi(df['close'], window=7).iloc[-1]
-        except:
-            indicators['rsi_fast'] = None
-            
-        try:
-            indicators['stoch_k'] = ta.momentum.stoch(df['high'], df['low'], df['close']).iloc[-1]
-        except:
-            indicators['stoch_k'] = None
-            
-        try:
-            indicators['stoch_d'] = ta.momentum.stoch_signal(df['high'], df['low'], df['close']).iloc[-1]
-        except:
-            indicators['stoch_d'] = None
+        indicators['rsi'] = rsi_last(close, window=14)
+        indicators['rsi_fast'] = rsi_last(close, window=7)
+        indicators['stoch_k'], indicators['stoch_d'] = stoch_last(high, low, close)
         
         # Trend Indicators
-        try:
-            indicators['macd'] = ta.trend.macd(df['close']).iloc[-1]
-        except:
-            indicators['macd'] = None
-            
-        try:
-            indicators['macd_signal'] = ta.trend.macd_signal(df['close']).iloc[-1]
-        except:
-            indicators['macd_signal'] = None
-            
-        try:
-            indicators['macd_hist'] = ta.trend.macd_diff(df['close']).iloc[-1]
-        except:
-            indicators['macd_hist'] = None
-            
-        try:
-            indicators['adx'] = ta.trend.adx(df['high'], df['low'], df['close']).iloc[-1]
-        except:
-            indicators['adx'] = None
+        indicators['macd'], indicators['macd_signal'], indicators['macd_hist'] = macd_last(close)
+        indicators['adx'] = adx_last(high, low, close)
         
         # Volatility Indicators
-        try:
-            indicators['bb_upper'] = ta.volatility.bollinger_hband(df['close']).iloc[-1]
-        except:
-            indicators['bb_upper'] = None
-            
-        try:
-            indicators['bb_lower'] = ta.volatility.bollinger_lband(df['close']).iloc[-1]
-        except:
-            indicators['bb_lower'] = None
-            
-        try:
-            indicators['bb_mid'] = ta.volatility.bollinger_mavg(df['close']).iloc[-1]
-        except:
-            indicators['bb_mid'] = None
-            
-        try:
-            indicators['atr'] = ta.volatility.average_true_range(df['high'], df['low'], df['close']).iloc[-1]
-        except:
-            indicators['atr'] = None
+        bb_upper, bb_mid, bb_lower = bollinger_last(close)
+        indicators['bb_upper'] = bb_upper
+        indicators['bb_lower'] = bb_lower
+        indicators['bb_mid'] = bb_mid
+        indicators['atr'] = atr_last(high, low, close)
         
         # Volume Indicators
-        try:
-            indicators['mfi'] = ta.volume.money_flow_index(df['high'], df['low'], df['close'], df['volume']).iloc[-1]
-        except:
-            indicators['mfi'] = None
-            
-        try:
-            indicators['vwap'] = ta.volume.volume_weighted_average_price(df['high'], df['low'], df['close'], df['volume']).iloc[-1]
-        except:
-            indicators['vwap'] = None
+        indicators['mfi'] = mfi_last(high, low, close, volume)
+        indicators['vwap'] = vwap_last(high, low, close, volume)
         
         # Additional useful indicators
-        try:
-            # Simple Moving Averages
-            indicators['sma_20'] = df['close'].rolling(window=20).mean().iloc[-1]
-            # Changed sma_50 to sma_30 to reduce data requirement
-            indicators['sma_30'] = df['close'].rolling(window=30).mean().iloc[-1] if len(df) >= 30 else None
-        except:
-            indicators['sma_20'] = None
-            indicators['sma_30'] = None
-            
-        try:
-            # Exponential Moving Averages
-            indicators['ema_12'] = df['close'].ewm(span=12).mean().iloc[-1]
-            indicators['ema_26'] = df['close'].ewm(span=26).mean().iloc[-1]
-        except:
-            indicators['ema_12'] = None
-            indicators['ema_26'] = None
+        # Simple Moving Averages (sma_30 instead of sma_50 to reduce data requirement)
+        indicators['sma_20'] = sma_last(close, 20)
+        indicators['sma_30'] = sma_last(close, 30)
+        # Exponential Moving Averages
+        indicators['ema_12'] = ema_last(close, 12)
+        indicators['ema_26'] = ema_last(close, 26)
         
         # Add current price data
-        indicators['close'] = df['close'].iloc[-1]
-        indicators['high'] = df['high'].iloc[-1]
-        indicators['low'] = df['low'].iloc[-1]
-        indicators['volume'] = df['volume'].iloc[-1]
-        
-        # Clean up NaN values
-        cleaned_indicators = {}
-        for key, value in indicators.items():
-            if pd.isna(value):
-                cleaned_indicators[key] = None
-            else:
-                cleaned_indicators[key] = float(value) if isinstance(value, (int, float, np.number)) else value
+        indicators['close'] = close[-1]
+        indicators['high'] = high[-1]
+        indicators['low'] = low[-1]
+        indicators['volume'] = volume[-1]
         
-        return cleaned_indicators
+        # Clean up NaN values; every indicator is a float at this point
+        return {key: None if math.isnan(value) else float(value) for key, value in indicators.items()}
     
     except Exception as e:
         print(f"Error calculating technical indicators: {e}")
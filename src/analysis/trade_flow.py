@@ -1,6 +1,15 @@
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 import numpy as np
 
+# Candidate field names per trade attribute, in priority order
+VALUE_FIELDS = ('value', 'amount', 'notional', 'trade_value')
+VOLUME_FIELDS = ('volume', 'shares', 'quantity', 'size', 'qty')
+SIDE_FIELDS = ('side', 'type', 'direction', 'action')
+PRICE_FIELDS = ('price', 'trade_price', 'execution_price')
+
+SIDE_NAMES = {'BUY': 'BUY', 'B': 'BUY', 'SELL': 'SELL', 'S': 'SELL'}
+SIDE_CODES = {'BUY': 1, 'SELL': -1, 'UNKNOWN': 0}
+
 def analyze_trade_flow(trades_data: Union[List[Dict], Dict], config: Dict) -> Dict:
     """
     Analyze trade flow patterns from trading data.
@@ -30,13 +39,18 @@ def analyze_trade_flow(trades_data: Union[List[Dict], Dict], config: Dict) -> Di
     
     institutional_threshold = config.get('strategy', {}).get('institutional_trade_threshold')
     
+    # Extract each trade field once into columnar arrays
+    values, volumes, prices, sides = extract_trade_arrays(trades)
+    
     # Enhanced trade classification
-    classified_trades = classify_trades(trades, institutional_threshold)
+    inst_mask = values >= institutional_threshold
+    inst_idx = np.flatnonzero(inst_mask)
+    retail_idx = np.flatnonzero(~inst_mask)
     
     # Enhanced metrics calculation
-    volume_metrics = calculate_volume_metrics(classified_trades)
-    price_impact = calculate_price_impact(classified_trades)
-    trade_patterns = analyze_trade_patterns(classified_trades)
+    volume_metrics = calculate_volume_metrics(values, volumes, sides, inst_mask)
+    price_impact = calculate_price_impact(trades, prices, inst_idx, retail_idx)
+    trade_patterns = analyze_trade_patterns(volumes, sides, inst_idx, retail_idx)
     
     return {
         'buy_pressure': volume_metrics['buy_pressure'],
@@ -48,47 +62,88 @@ def analyze_trade_flow(trades_data: Union[List[Dict], Dict], config: Dict) -> Di
         'volume_metrics': metrics  # Include the raw metrics from fetch_recent_trades
     }
 
-def classify_trades(trades: List[Dict], threshold: float) -> Dict:
+def extract_trade_arrays(trades: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    Classify trades as institutional or retail based on value threshold.
+    Extract value, volume, price and side columns from trade dictionaries.
     
     Args:
         trades: List of trade dictionaries
-        threshold: Value threshold for institutional classification
         
     Returns:
-        Dictionary with classified trades
+        Tuple of (value, volume, price, side) arrays; side is 1 for BUY,
+        -1 for SELL and 0 when unknown
     """
-    institutional_trades = []
-    retail_trades = []
-    
-    for trade in trades:
-        # Calculate trade value - handle different field names
-        value = get_trade_value(trade)
+    count = len(trades)
+    values = np.empty(count)
+    volumes = np.empty(count)
+    prices = np.empty(count)
+    sides = np.empty(count, dtype=np.int8)
+    
+    # A feed uses the same field names for every trade, so resolve them once
+    # from the first trade; trades with a different shape, or whose resolved
+    # field is empty or unparseable, fall back to the full lookup
+    shape = trades[0].keys()
+    value_key = _first_field(trades[0], VALUE_FIELDS)
+    volume_key = _first_field(trades[0], VOLUME_FIELDS)
+    side_key = _first_field(trades[0], SIDE_FIELDS)
+    price_key = _first_field(trades[0], PRICE_FIELDS)
+    
+    # Single pass over the trades; the volume is parsed once and reused for the value
+    for i, trade in enumerate(trades):
+        if trade.keys() != shape:
+            volume = get_trade_volume(trade)
+            volumes[i] = volume
+            values[i] = get_trade_value(trade, volume)
+            prices[i] = get_trade_price(trade)
+            sides[i] = SIDE_CODES[get_trade_side(trade)]
+            continue
+        
+        volume = _to_float(trade[volume_key]) if volume_key else 0
+        if volume is None:
+            volume = get_trade_volume(trade)
+        volumes[i] = volume
+        
+        value = _to_float(trade[value_key]) if value_key else _value_from_price(trade, volume)
+        values[i] = get_trade_value(trade, volume) if value is None else value
+        
+        price = _to_float(trade[price_key]) if price_key else 0
+        prices[i] = get_trade_price(trade) if price is None else price
         
-        if value >= threshold:
-            institutional_trades.append(trade)
-        else:
-            retail_trades.append(trade)
+        side = SIDE_NAMES.get(str(trade[side_key]).upper()) if side_key and trade[side_key] is not None else None
+        sides[i] = SIDE_CODES[get_trade_side(trade) if side is None else side]
     
-    return {
-        'institutional': institutional_trades,
-        'retail': retail_trades
-    }
+    return values, volumes, prices, sides
+
+def _first_field(trade: Dict, fields: Tuple[str, ...]) -> Optional[str]:
+    return next((field for field in fields if field in trade), None)
 
-def get_trade_value(trade: Dict) -> float:
+def _to_float(raw) -> Optional[float]:
+    if raw is None:
+        return None
+    try:
+        return float(raw)
+    except (ValueError, TypeError):
+        return None
+
+def _value_from_price(trade: Dict, volume: float) -> float:
+    price = trade.get('price', 0)
+    if price and volume:
+        return price * volume
+    return 0
+
+def get_trade_value(trade: Dict, volume: Optional[float] = None) -> float:
     """
     Extract trade value from trade dictionary, handling different field names.
     
     Args:
         trade: Trade dictionary
+        volume: Already parsed trade volume, if available
         
     Returns:
         Trade value as float
     """
     # Try different common field names for trade value
-    value_fields = ['value', 'amount', 'notional', 'trade_value']
-    for field in value_fields:
+    for field in VALUE_FIELDS:
         if field in trade and trade[field] is not None:
             try:
                 return float(trade[field])
@@ -96,13 +151,9 @@ def get_trade_value(trade: Dict) -> float:
                 continue
     
     # Calculate from price and volume if available
-    price = trade.get('price', 0)
-    volume = get_trade_volume(trade)
-    
-    if price and volume:
-        return price * volume
-    
-    return 0
+    if volume is None:
+        volume = get_trade_volume(trade)
+    return _value_from_price(trade, volume)
 
 def get_trade_volume(trade: Dict) -> float:
     """
@@ -115,8 +166,7 @@ def get_trade_volume(trade: Dict) -> float:
         Trade volume as float
     """
     # Try different common field names for volume
-    volume_fields = ['volume', 'shares', 'quantity', 'size', 'qty']
-    for field in volume_fields:
+    for field in VOLUME_FIELDS:
         if field in trade and trade[field] is not None:
             try:
                 return float(trade[field])
@@ -136,114 +186,75 @@ def get_trade_side(trade: Dict) -> str:
         Trade side as string (BUY/SELL)
     """
     # Try different common field names for trade side
-    side_fields = ['side', 'type', 'direction', 'action']
-    for field in side_fields:
+    for field in SIDE_FIELDS:
         if field in trade and trade[field] is not None:
-            side = str(trade[field]).upper()
-            if side in ['BUY', 'SELL', 'B', 'S']:
-                return 'BUY' if side in ['BUY', 'B'] else 'SELL'
+            side = SIDE_NAMES.get(str(trade[field]).upper())
+            if side:
+                return side
     
     return 'UNKNOWN'
 
-def calculate_volume_metrics(classified_trades: Dict) -> Dict:
+def calculate_volume_metrics(values: np.ndarray, volumes: np.ndarray,
+                             sides: np.ndarray, inst_mask: np.ndarray) -> Dict:
     """
-    Calculate volume-based metrics from classified trades.
+    Calculate volume-based metrics from trade columns.
     
     Args:
-        classified_trades: Dictionary with institutional and retail trades
+        values: Trade values
+        volumes: Trade volumes
+        sides: Trade side codes
+        inst_mask: True for institutional trades
         
     Returns:
         Dictionary with volume metrics
     """
-    inst_value = sum(get_trade_value(t) for t in classified_trades['institutional'])
-    retail_value = sum(get_trade_value(t) for t in classified_trades['retail'])
-    total_value = inst_value + retail_value
+    inst_value = float(values[inst_mask].sum())
+    total_value = inst_value + float(values[~inst_mask].sum())
+    
+    total_volume = float(volumes.sum())
+    buy_volume = float(volumes[sides == 1].sum())
+    sell_volume = float(volumes[sides == -1].sum())
     
     return {
         'institutional_ratio': inst_value / total_value if total_value > 0 else 0,
-        'buy_pressure': calculate_buy_pressure(classified_trades),
-        'sell_pressure': calculate_sell_pressure(classified_trades)
+        'buy_pressure': buy_volume / total_volume if total_volume > 0 else 0,
+        'sell_pressure': sell_volume / total_volume if total_volume > 0 else 0
     }
 
-def calculate_buy_pressure(classified_trades: Dict) -> float:
-    """
-    Calculate buy pressure from classified trades.
-    
-    Args:
-        classified_trades: Dictionary with institutional and retail trades
-        
-    Returns:
-        Buy pressure ratio (0-1)
-    """
-    total_buy_volume = 0
-    total_volume = 0
-    
-    for category in ['institutional', 'retail']:
-        for trade in classified_trades[category]:
-            volume = get_trade_volume(trade)
-            side = get_trade_side(trade)
-            
-            if side == 'BUY':
-                total_buy_volume += volume
-            total_volume += volume
-    
-    return total_buy_volume / total_volume if total_volume > 0 else 0
-
-def calculate_sell_pressure(classified_trades: Dict) -> float:
-    """
-    Calculate sell pressure from classified trades.
-    
-    Args:
-        classified_trades: Dictionary with institutional and retail trades
-        
-    Returns:
-        Sell pressure ratio (0-1)
-    """
-    total_sell_volume = 0
-    total_volume = 0
-    
-    for category in ['institutional', 'retail']:
-        for trade in classified_trades[category]:
-            volume = get_trade_volume(trade)
-            side = get_trade_side(trade)
-            
-            if side == 'SELL':
-                total_sell_volume += volume
-            total_volume += volume
-    
-    return total_sell_volume / total_volume if total_volume > 0 else 0
-
-def calculate_price_impact(classified_trades: Dict) -> float:
+def calculate_price_impact(trades: List[Dict], prices: np.ndarray,
+                           inst_idx: np.ndarray, retail_idx: np.ndarray) -> float:
     """
-    Calculate price impact from classified trades.
+    Calculate price impact from institutional and retail trades.
     
     Args:
-        classified_trades: Dictionary with institutional and retail trades
+        trades: List of trade dictionaries
+        prices: Trade prices
+        inst_idx: Indices of institutional trades
+        retail_idx: Indices of retail trades
         
     Returns:
         Average price impact
     """
     price_changes = []
     
-    for category in ['institutional', 'retail']:
-        trades = classified_trades[category]
-        # Sort trades by timestamp if available
-        if trades and 'timestamp' in trades[0]:
+    for idx in (inst_idx, retail_idx):
+        # Sort trades by timestamp if available; feeds are usually already in order
+        if len(idx) and 'timestamp' in trades[idx[0]]:
             try:
-                trades = sorted(trades, key=lambda x: x.get('timestamp', 0))
-            except:
+                timestamps = [trades[i].get('timestamp', 0) for i in idx]
+                if any(later < earlier for earlier, later in zip(timestamps, timestamps[1:])):
+                    order = sorted(range(len(idx)), key=timestamps.__getitem__)
+                    idx = idx[order]
+            except TypeError:
                 pass
         
-        for i, trade in enumerate(trades):
-            if i > 0:
-                prev_price = get_trade_price(trades[i-1])
-                curr_price = get_trade_price(trade)
-                
-                if prev_price > 0 and curr_price > 0:
-                    price_change = (curr_price - prev_price) / prev_price
-                    price_changes.append(price_change)
-    
-    return float(np.mean(price_changes)) if price_changes else 0
+        category_prices = prices[idx]
+        prev_prices, curr_prices = category_prices[:-1], category_prices[1:]
+        valid = (prev_prices > 0) & (curr_prices > 0)
+        price_changes.append((curr_prices[valid] - prev_prices[valid]) / prev_prices[valid])
+    
+    price_changes = np.concatenate(price_changes)
+    return float(price_changes.mean()) if len(price_changes) else 0
 
 def get_trade_price(trade: Dict) -> float:
     """
@@ -255,8 +266,7 @@ def get_trade_price(trade: Dict) -> float:
     Returns:
         Trade price as float
     """
-    price_fields = ['price', 'trade_price', 'execution_price']
-    for field in price_fields:
+    for field in PRICE_FIELDS:
         if field in trade and trade[field] is not None:
             try:
                 return float(trade[field])
@@ -265,12 +275,16 @@ def get_trade_price(trade: Dict) -> float:
     
     return 0
 
-def analyze_trade_patterns(classified_trades: Dict) -> Dict:
+def analyze_trade_patterns(volumes: np.ndarray, sides: np.ndarray,
+                           inst_idx: np.ndarray, retail_idx: np.ndarray) -> Dict:
     """
-    Analyze trading patterns from classified trades.
+    Analyze trading patterns from institutional and retail trades.
     
     Args:
-        classified_trades: Dictionary with institutional and retail trades
+        volumes: Trade volumes
+        sides: Trade side codes
+        inst_idx: Indices of institutional trades
+        retail_idx: Indices of retail trades
         
     Returns:
         Dictionary with pattern analysis
@@ -283,14 +297,11 @@ def analyze_trade_patterns(classified_trades: Dict) -> Dict:
         'volume_surge': False
     }
     
-    inst_trades = classified_trades['institutional']
-    retail_trades = classified_trades['retail']
-    
     # Check institutional patterns
-    if inst_trades:
-        recent_inst = inst_trades[-min(5, len(inst_trades)):]
-        buy_count = sum(1 for t in recent_inst if get_trade_side(t) == 'BUY')
-        sell_count = sum(1 for t in recent_inst if get_trade_side(t) == 'SELL')
+    if len(inst_idx):
+        recent_inst = sides[inst_idx[-5:]]
+        buy_count = int((recent_inst == 1).sum())
+        sell_count = int((recent_inst == -1).sum())
         total_count = buy_count + sell_count
         
         if total_count > 0:
@@ -299,10 +310,10 @@ def analyze_trade_patterns(classified_trades: Dict) -> Dict:
             patterns['institutional_selling'] = buy_ratio < 0.3
     
     # Check retail patterns
-    if retail_trades:
-        recent_retail = retail_trades[-min(10, len(retail_trades)):]
-        buy_count = sum(1 for t in recent_retail if get_trade_side(t) == 'BUY')
-        sell_count = sum(1 for t in recent_retail if get_trade_side(t) == 'SELL')
+    if len(retail_idx):
+        recent_retail = sides[retail_idx[-10:]]
+        buy_count = int((recent_retail == 1).sum())
+        sell_count = int((recent_retail == -1).sum())
         total_count = buy_count + sell_count
         
         if total_count > 0:
@@ -310,15 +321,12 @@ def analyze_trade_patterns(classified_trades: Dict) -> Dict:
             patterns['retail_accumulation'] = buy_ratio > 0.6
             patterns['retail_distribution'] = buy_ratio < 0.4
     
-    # Check volume surge
-    all_trades = inst_trades + retail_trades
-    if len(all_trades) >= 10:
-        try:
-            recent_vol = sum(get_trade_volume(t) for t in all_trades[-5:])
-            prev_vol = sum(get_trade_volume(t) for t in all_trades[-10:-5])
-            patterns['volume_surge'] = recent_vol > prev_vol * 1.5 if prev_vol > 0 else False
-        except:
-            patterns['volume_surge'] = False
+    # Check volume surge over institutional trades followed by retail trades
+    all_idx = np.concatenate((inst_idx, retail_idx))
+    if len(all_idx) >= 10:
+        recent_vol = float(volumes[all_idx[-5:]].sum())
+        prev_vol = float(volumes[all_idx[-10:-5]].sum())
+        patterns['volume_surge'] = recent_vol > prev_vol * 1.5 if prev_vol > 0 else False
     
     return patterns
 
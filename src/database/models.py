@@ -1,18 +1,23 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from .postgres import Base
 
 class SignalHistory(Base):
     __tablename__ = "signal_history"
+    __table_args__ = (
+        # "Latest signals for a symbol" lookups
+        Index('ix_signal_history_symbol_timestamp', 'symbol', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     symbol = Column(String)
-    timestamp = Column(DateTime, default=datetime.now)
+    timestamp = Column(DateTime, default=datetime.now, index=True)
     price = Column(Float)
     signal_type = Column(String)
-    technical_indicators = Column(JSON)
-    market_depth = Column(JSON)
-    trade_flow = Column(JSON)
+    technical_indicators = Column(JSONB)
+    market_depth = Column(JSONB)
+    trade_flow = Column(JSONB)
     signal_strength = Column(Float)
     market_cap = Column(Float)
     sector = Column(String)
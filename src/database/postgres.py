@@ -3,6 +3,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from ..utils.config import load_config
+from ..utils.serialization import json_dumps, json_loads
 
 config = load_config()
 db_config = config['database']
@@ -10,7 +11,16 @@ db_config = config['database']
 password = quote_plus(db_config['password'])
 POSTGRES_URL = f"postgresql://{db_config['user']}:{password}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
 
-engine = create_engine(POSTGRES_URL)
+engine = create_engine(
+    POSTGRES_URL,
+    pool_size=db_config.get('pool_size', 20),
+    max_overflow=db_config.get('max_overflow', 10),
+    pool_timeout=db_config.get('pool_timeout', 30),
+    pool_recycle=db_config.get('pool_recycle', 1800),
+    pool_pre_ping=True,
+    json_serializer=json_dumps,
+    json_deserializer=json_loads
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
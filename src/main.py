@@ -1,10 +1,13 @@
 import asyncio
 import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
-import aiohttp
 from datetime import datetime, date
 
-from src.database.postgres import get_db
+from src.database.postgres import get_db, SessionLocal
+from src.database.models import SignalHistory
 from src.services.market_data import MarketDataService
 from src.services.telegram import TelegramService
 from src.analysis.signal_generator import SignalGenerator
@@ -20,76 +23,129 @@ def format_market_cap(market_cap):
     elif market_cap >= 1e6:
         return f"{market_cap / 1e6:.2f}M EGP"
     return f"{market_cap / 1e3:.2f}K EGP"
+
+# What the daily dedup remembers about the last alert sent for a symbol
+LastSignal = namedtuple('LastSignal', ('signal_type', 'signal_strength'))
+
+# Telegram message for a trading signal, filled with str.format_map
+SIGNAL_MESSAGE_TEMPLATE = (
+    "{update_note}🚀 *{signal_type} SIGNAL*\n"
+    "*{name} ({symbol})*\n\n"
+    "{action_line}"
+    "💰 *Current Price:* `{price:.2f} EGP`\n"
+    "🎯 *Entry Target:* `{adjusted_buy_price:.2f} EGP`\n"
+    "📊 *Change:* `{change_pct:.2f}%`\n"
+    "🏢 *Market Cap:* `{market_cap}`\n"
+    "🏭 *Sector:* {sector}\n"
+    "📈 *P/E:* `{pe_ratio:.2f}`\n\n"
+    "📊 *Technical Indicators:*\n"
+    "• RSI(14): `{rsi:.1f}`\n"
+    "• MACD: `{macd:.3f}`\n"
+    "• ATR: `{atr:.2f}`\n\n"
+    "🎯 *Signal Breakdown:*\n"
+    "• Technical: `{tech_score}/8`\n" # Updated Max Score
+    "• Trade Flow: `{flow_score}/2`\n"
+    "• Market Depth: `{depth_score}/2`\n\n"
+    "⭐ *Overall Strength:* `{overall_strength:.0%}`\n\n"
+    "🎯 *Exit Strategy:*\n"
+    "🔴 *Stop-Loss:* `{stop_loss:.2f} EGP`\n"
+    "🟢 *Take-Profit:* `{take_profit:.2f} EGP`\n"
+    "📏 *Risk/Reward:* `1:{risk_reward:.1f}`"
+)
     
 class TradingApp:
     def __init__(self, config: Dict):
         self.config = config
+        # Settings read on every cycle, resolved once
+        self.headers = config['api_settings']['headers']
+        self.scan_interval = config.get('scan_interval_seconds', 10)
+        self.max_concurrent = config.get('max_concurrent', 2)
+        self.wallet_value = config.get('total_wallet_value', 0)
+        self.risk_per_trade_pct = config.get('risk_per_trade_percentage', 0.01)
         self.rate_limiter = RateLimiter(
-            max_concurrent=config.get('max_concurrent', 2),
+            max_concurrent=self.max_concurrent,
             requests_per_minute=config['api_settings'].get('rate_limit_requests_per_minute', 60)
         )
         self.market_data = MarketDataService(config, self.rate_limiter)
         self.signal_generator = SignalGenerator(config)
         self.db = next(get_db())
+        # Signal writes run on one dedicated thread, in the order they were issued
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='signal-store')
         self.telegram = TelegramService(config, self.db)
         self.logger = logging.getLogger(__name__)
-        self.sent_signals_today: Dict[str, Dict] = {}
+        self.sent_signals_today: Dict[str, LastSignal] = {}
         self.current_date: date = datetime.now().date()
         self.min_signal_strength = self.config.get('strategy', {}).get('min_signal_strength', 0.75) # Updated Default
 
     async def run(self):
         self.logger.info("Starting trading application...")
         
-        while True:
-            try:
-                await self.telegram.process_updates()
-                await self._process_market_cycle()
-                await asyncio.sleep(self.config.get('scan_interval_seconds', 10))
+        try:
+            while True:
+                try:
+                    await self.telegram.process_updates()
+                    await self._process_market_cycle()
+                    await asyncio.sleep(self.scan_interval)
 
-            except Exception as e:
-                self.logger.error(f"Error in main application loop: {e}")
-                await self.telegram.send_alert('error', f"Critical application error: {str(e)}", 'high')
-                await asyncio.sleep(60)
+                except Exception as e:
+                    self.logger.error("Error in main application loop: %s", e)
+                    await self.telegram.send_alert('error', f"Critical application error: {str(e)}", 'high')
+                    await asyncio.sleep(60)
+        finally:
+            await self.market_data.aclose()
+            await self.telegram.aclose()
 
     async def _process_market_cycle(self):
-        async with aiohttp.ClientSession() as session:
-            stocks = await self.market_data.fetch_market_data(
-                session, 
-                self.config['api_settings']['headers']
-            )
-            
-            for stock in stocks:
+        stocks = await self.market_data.fetch_market_data(self.headers)
+        now_ms = int(time.time() * 1000)
+        
+        # Analyze stocks concurrently, bounded like the HTTP rate limiter
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def analyze(stock: Dict):
+            async with semaphore:
                 try:
-                    signal = await self._analyze_stock(session, stock)
-             
-                    if not signal or signal['signal_type'] == 'NEUTRAL':
-                        continue
+                    return await self._analyze_stock(stock, now_ms)
+                except Exception as e:
+                    self.logger.error("Error analyzing %s: %s", stock.get('symbol'), e)
+                    return None
 
-                    if signal['signal_strength'] >= self.min_signal_strength:
-                        self.logger.info(f"Strong signal found for {stock.get('symbol')}: {signal['signal_type']} ({signal['signal_strength']:.2f})")
-                        await self._process_signals([signal])
-                    else:
-                        self.logger.info(f"Weak signal for {stock.get('symbol')} ({signal['signal_strength']:.2f}) below threshold {self.min_signal_strength}. Discarding.")
+        results = await asyncio.gather(*(analyze(stock) for stock in stocks))
 
-                except Exception as e:
-                    self.logger.error(f"Error analyzing {stock.get('symbol')}: {e}")
-                
-                finally:
-                    await asyncio.sleep(1)
+        strong_signals = []
+        for stock, signal in zip(stocks, results):
+            if not signal or signal['signal_type'] == 'NEUTRAL':
+                continue
 
-    async def _analyze_stock(self, session: aiohttp.ClientSession, stock: Dict) -> Dict:
+            if signal['signal_strength'] >= self.min_signal_strength:
+                self.logger.info(
+                    "Strong signal found for %s: %s (%.2f)",
+                    stock.get('symbol'), signal['signal_type'], signal['signal_strength']
+                )
+                strong_signals.append(signal)
+            else:
+                self.logger.debug(
+                    "Weak signal for %s (%.2f) below threshold %s. Discarding.",
+                    stock.get('symbol'), signal['signal_strength'], self.min_signal_strength
+                )
+
+        if strong_signals:
+            try:
+                await self._process_signals(strong_signals)
+            except Exception as e:
+                self.logger.error("Error processing signals: %s", e)
+
+    async def _analyze_stock(self, stock: Dict, now_ms: int) -> Dict:
         asset_id = stock.get('asset_id')
         if not asset_id:
             return None
 
-        historical_data = await self.market_data.fetch_historical_data(
-            session, self.config['api_settings']['headers'], asset_id
-        )
-        market_depth = await self.market_data.fetch_market_depth(
-            session, self.config['api_settings']['headers'], asset_id
-        )
-        trades_data = await self.market_data.fetch_recent_trades(
-            session, self.config['api_settings']['headers'], asset_id
+        # The three requests are independent, so issue them together; the
+        # rate limiter still bounds how many are in flight
+        historical_data, market_depth, trades_data = await asyncio.gather(
+            self.market_data.fetch_historical_data(self.headers, asset_id, now_ms),
+            self.market_data.fetch_market_depth(self.headers, asset_id),
+            self.market_data.fetch_recent_trades(self.headers, asset_id)
         )
 
         return await self.signal_generator.analyze_stock(
@@ -101,15 +157,13 @@ class TradingApp:
         Processes generated signals by calculating position size,
         storing them, and sending alerts.
         """
+        risk_per_trade_egp = self.wallet_value * self.risk_per_trade_pct
+
         for signal in signals:
-            risk_metrics = signal.get('risk_metrics', {})
-            buy_price = risk_metrics.get('adjusted_buy_price', signal.get('price', 0)) # Use adjusted price
+            risk_metrics = signal['risk_metrics']
+            buy_price = risk_metrics.get('adjusted_buy_price', signal['price']) # Use adjusted price
             stop_loss_price = risk_metrics.get('stop_loss', 0)
             
-            wallet_value = self.config.get('total_wallet_value', 0)
-            risk_pct = self.config.get('risk_per_trade_percentage', 0.01)
-            
-            risk_per_trade_egp = wallet_value * risk_pct
             risk_per_share = buy_price - stop_loss_price
 
             shares_to_buy = 0
@@ -122,37 +176,52 @@ class TradingApp:
             signal['shares_to_buy'] = shares_to_buy
             signal['position_size_egp'] = position_size_egp
 
-            await self._store_signal(signal)
-
+        await self._store_signals(signals)
         await self._send_signal_alerts(signals)
 
-    async def _store_signal(self, signal: Dict):
+    async def _store_signals(self, signals: List[Dict]):
+        if not signals:
+            return
+        # The database driver is blocking, so keep the write off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._db_executor, self._store_signals_sync, signals)
+
+    def _store_signals_sync(self, signals: List[Dict]):
+        # Runs in a worker thread, so it uses its own session rather than self.db.
+        # All signals go in one transaction: a single flush and commit per batch.
+        db = SessionLocal()
         try:
-            from .database.models import SignalHistory
-            signal_timestamp = signal.get('timestamp')
-            record_timestamp = datetime.fromtimestamp(signal_timestamp / 1000) if signal_timestamp else datetime.now()
-            
-            risk_metrics = signal.get('risk_metrics', {})
-            signal_record = SignalHistory(
-                symbol=signal['symbol'],
-                timestamp=record_timestamp,
-                price=signal['price'],
-                signal_type=signal['signal_type'],
-                technical_indicators=signal['technical_indicators'],
-                market_depth=signal['trade_flow_metrics'],
-                trade_flow=signal['trade_flow_metrics'],
-                signal_strength=signal['signal_strength'],
-                target=risk_metrics.get('take_profit'),
-                buy_price=risk_metrics.get('adjusted_buy_price'),
-                stop_loss=risk_metrics.get('stop_loss'),
-                position_size_egp=signal.get('position_size_egp'),
-                shares_to_buy=signal.get('shares_to_buy')
-            )
-            self.db.add(signal_record)
-            self.db.commit()
+            records = []
+            for signal in signals:
+                signal_timestamp = signal.get('timestamp')
+                record_timestamp = datetime.fromtimestamp(signal_timestamp / 1000) if signal_timestamp else datetime.now()
+                
+                risk_metrics = signal['risk_metrics']
+                records.append(SignalHistory(
+                    symbol=signal['symbol'],
+                    timestamp=record_timestamp,
+                    price=signal['price'],
+                    signal_type=signal['signal_type'],
+                    technical_indicators=signal['technical_indicators'],
+                    market_depth=signal['market_depth_metrics'],
+                    trade_flow=signal['trade_flow_metrics'],
+                    signal_strength=signal['signal_strength'],
+                    target=risk_metrics.get('take_profit'),
+                    buy_price=risk_metrics.get('adjusted_buy_price'),
+                    stop_loss=risk_metrics.get('stop_loss'),
+                    position_size_egp=signal['position_size_egp'],
+                    shares_to_buy=signal['shares_to_buy']
+                ))
+            db.add_all(records)
+            db.commit()
         except Exception as e:
-            self.logger.error(f"Failed to store signal for {signal.get('symbol')}: {e}")
-            self.db.rollback()     
+            self.logger.error(
+                "Failed to store signals for %s: %s",
+                ', '.join(str(signal.get('symbol')) for signal in signals), e
+            )
+            db.rollback()
+        finally:
+            db.close()
 
     async def _send_signal_alerts(self, signals: List[Dict]):
         today = datetime.now().date()
@@ -165,45 +234,34 @@ class TradingApp:
             if not symbol:
                 continue
 
+            signal_type = signal['signal_type']
+            signal_strength = signal['signal_strength']
             last_signal = self.sent_signals_today.get(symbol)
             is_different = (
                 not last_signal or
-                last_signal.get('signal_type') != signal.get('signal_type') or
-                abs(last_signal.get('signal_strength', 0) - signal.get('signal_strength', 0)) > 0.05
+                last_signal.signal_type != signal_type or
+                abs(last_signal.signal_strength - signal_strength) > 0.05
             )
 
             if is_different:
                 is_update = last_signal is not None
                 message = self._format_signal_message(signal, is_update=is_update)
                 await self.telegram.send_alert('signal', message)
-                self.sent_signals_today[symbol] = signal
+                self.sent_signals_today[symbol] = LastSignal(signal_type, signal_strength)
 
     def _format_signal_message(self, signal: Dict, is_update: bool = False) -> str:
-        stock_details = signal.get('stock_details', {})
-        risk_metrics = signal.get('risk_metrics', {})
-        tech_indicators = signal.get('technical_indicators', {})
-        component_scores = signal.get('component_scores', {})
-
-        price = signal.get('price', 0)
-        signal_type = signal.get('signal_type', 'N/A').replace('_', ' ').upper()
-        overall_strength = signal.get('signal_strength', 0)
-        adjusted_buy_price = risk_metrics.get('adjusted_buy_price', 0)
-        name = stock_details.get('name', 'N/A')
-        symbol = stock_details.get('symbol', 'N/A')
-        change_pct = stock_details.get('last_change_prc', 0)
-        market_cap = format_market_cap(stock_details.get('market_cap', 0))
-        sector = stock_details.get('industry', 'N/A')
-        pe_ratio = stock_details.get('pe_ratio', 0)
-        rsi = tech_indicators.get('rsi', 0)
-        macd = tech_indicators.get('macd', 0)
-        atr = tech_indicators.get('atr', 0)
-        tech_score = component_scores.get('technical', 0)
-        flow_score = component_scores.get('trade_flow', 0)
-        depth_score = component_scores.get('market_depth', 0)
-        stop_loss = risk_metrics.get('stop_loss', 0)
-        take_profit = risk_metrics.get('take_profit', 0)
-        position_size_egp = signal.get('position_size_egp', 0)
-        shares_to_buy = signal.get('shares_to_buy', 0)
+        # Bind the accessors once; every field below is optional
+        get = signal.get
+        stock_get = get('stock_details', {}).get
+        risk_get = get('risk_metrics', {}).get
+        tech_get = get('technical_indicators', {}).get
+        score_get = get('component_scores', {}).get
+
+        adjusted_buy_price = risk_get('adjusted_buy_price', 0)
+        stop_loss = risk_get('stop_loss', 0)
+        take_profit = risk_get('take_profit', 0)
+        position_size_egp = get('position_size_egp', 0)
+        shares_to_buy = get('shares_to_buy', 0)
         
         action_line = f"💰 *ACTION: Invest {position_size_egp:,.2f} EGP ({shares_to_buy} shares)*\n\n"
         
@@ -211,29 +269,26 @@ class TradingApp:
         reward_per_share = take_profit - adjusted_buy_price
         risk_reward = reward_per_share / risk_per_share if risk_per_share > 0 else 0
 
-        update_note = "🔥 *UPDATE* 🔥\n" if is_update else ""
-
-        return (
-            f"{update_note}🚀 *{signal_type} SIGNAL*\n"
-            f"*{name} ({symbol})*\n\n"
-            f"{action_line if position_size_egp > 0 else ''}"
-            f"💰 *Current Price:* `{price:.2f} EGP`\n"
-            f"🎯 *Entry Target:* `{adjusted_buy_price:.2f} EGP`\n"
-            f"📊 *Change:* `{change_pct:.2f}%`\n"
-            f"🏢 *Market Cap:* `{market_cap}`\n"
-            f"🏭 *Sector:* {sector}\n"
-            f"📈 *P/E:* `{pe_ratio:.2f}`\n\n"
-            f"📊 *Technical Indicators:*\n"
-            f"• RSI(14): `{rsi:.1f}`\n"
-            f"• MACD: `{macd:.3f}`\n"
-            f"• ATR: `{atr:.2f}`\n\n"
-            f"🎯 *Signal Breakdown:*\n"
-            f"• Technical: `{tech_score}/8`\n" # Updated Max Score
-            f"• Trade Flow: `{flow_score}/2`\n"
-            f"• Market Depth: `{depth_score}/2`\n\n"
-            f"⭐ *Overall Strength:* `{overall_strength:.0%}`\n\n"
-            f"🎯 *Exit Strategy:*\n"
-            f"🔴 *Stop-Loss:* `{stop_loss:.2f} EGP`\n"
-            f"🟢 *Take-Profit:* `{take_profit:.2f} EGP`\n"
-            f"📏 *Risk/Reward:* `1:{risk_reward:.1f}`"
-        )
\ No newline at end of file
+        return SIGNAL_MESSAGE_TEMPLATE.format_map({
+            'update_note': "🔥 *UPDATE* 🔥\n" if is_update else "",
+            'signal_type': get('signal_type', 'N/A').replace('_', ' ').upper(),
+            'name': stock_get('name', 'N/A'),
+            'symbol': stock_get('symbol', 'N/A'),
+            'action_line': action_line if position_size_egp > 0 else '',
+            'price': get('price', 0),
+            'adjusted_buy_price': adjusted_buy_price,
+            'change_pct': stock_get('last_change_prc', 0),
+            'market_cap': format_market_cap(stock_get('market_cap', 0)),
+            'sector': stock_get('industry', 'N/A'),
+            'pe_ratio': stock_get('pe_ratio', 0),
+            'rsi': tech_get('rsi', 0),
+            'macd': tech_get('macd', 0),
+            'atr': tech_get('atr', 0),
+            'tech_score': score_get('technical', 0),
+            'flow_score': score_get('trade_flow', 0),
+            'depth_score': score_get('market_depth', 0),
+            'overall_strength': get('signal_strength', 0),
+            'stop_loss': stop_loss,
+            'take_profit': take_profit,
+            'risk_reward': risk_reward
+        })
\ No newline at end of file
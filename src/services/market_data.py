@@ -1,27 +1,81 @@
-from datetime import datetime, timedelta, time, date
+from collections import OrderedDict
+from datetime import datetime, timedelta, time
+from time import monotonic
+from itertools import chain
 import logging
 import aiohttp
 import asyncio
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from ..utils.rate_limiter import RateLimiter
+from ..utils.serialization import json_loads
+
+# Upper bound on the number of assets whose candle history is kept between cycles
+HISTORICAL_CACHE_MAX_ENTRIES = 512
+# Upper bound on the number of assets whose static details are cached
+STATIC_CACHE_MAX_ENTRIES = 2000
+# Transient API failures (rate limiting and gateway errors) are retried with backoff
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+FETCH_MAX_ATTEMPTS = 3
+MAX_RETRY_DELAY_SECONDS = 30
 
 class MarketDataService:
     def __init__(self, config: Dict, rate_limiter: RateLimiter):
         self.config = config
         self.rate_limiter = rate_limiter
         self.base_url = "https://prod.thndr.app/assets-service"
+        self.marketwatch_url = f"{self.base_url}/assets/marketwatch?market=egypt"
+        self.asset_details_url = self.base_url + "/assets/{}?include_feed=true&feed_detail=true"
         self.logger = logging.getLogger(__name__)
+        self.request_timeout = aiohttp.ClientTimeout(total=config['api_settings'].get('request_timeout_seconds', 30))
+        # Shared by every request; created on first use so it binds to the running loop
+        self._session: Optional[aiohttp.ClientSession] = None
         # --- Caching Mechanism for Static Data ---
-        self.static_stock_data_cache: Dict[str, Dict] = {}
-        self.last_cache_date: Optional[date] = None
+        # Details per asset as (expires_at, details) on the monotonic clock (LRU)
+        self.static_stock_data_cache: OrderedDict[str, Tuple[float, Dict]] = OrderedDict()
+        self.static_cache_ttl = config['api_settings'].get('static_cache_ttl_seconds', 3600)
+        # Stock filters, evaluated for every listed stock each cycle
+        strategy_config = config['strategy']
+        self.min_price = strategy_config.get('min_price', 0)
+        self.max_price = strategy_config.get('max_price', float('inf'))
+        self.min_market_cap = strategy_config.get('min_market_cap', 0)
+        self.blacklist_symbols = frozenset(strategy_config.get('blacklist_symbols', []))
+        # Candle history per asset as (covered_from_ms, points), refreshed
+        # incrementally between cycles (LRU)
+        self.historical_data_cache: OrderedDict[str, Tuple[int, List[Dict]]] = OrderedDict()
         
-    async def fetch_json(self, session: aiohttp.ClientSession, url: str, headers: Dict) -> Optional[Dict]:
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config['api_settings'].get('conn_limit', 50),
+                limit_per_host=20,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def aclose(self):
+        """Closes the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def fetch_json(self, url: str, headers: Dict) -> Optional[Dict]:
         try:
-            async with self.rate_limiter:
-                timeout = aiohttp.ClientTimeout(total=self.config['api_settings'].get('request_timeout_seconds', 30))
-                async with session.get(url, headers=headers, timeout=timeout) as resp:
-                    resp.raise_for_status()
-                    return await resp.json()
+            session = await self._get_session()
+            for attempt in range(FETCH_MAX_ATTEMPTS):
+                async with self.rate_limiter:
+                    async with session.get(url, headers=headers, timeout=self.request_timeout) as resp:
+                        if resp.status in RETRY_STATUSES and attempt < FETCH_MAX_ATTEMPTS - 1:
+                            delay = self._retry_delay(resp.headers.get('Retry-After'), attempt)
+                        else:
+                            resp.raise_for_status()
+                            body = await resp.read()
+                            return json_loads(body) if body else None
+                # Back off outside the rate limiter so other requests can use the slot
+                self.logger.warning(f"API request for {url} returned {resp.status}, retrying in {delay:g}s")
+                await asyncio.sleep(delay)
         except aiohttp.ClientError as e:
             self.logger.error(f"API request failed for {url}: {e}")
             return None
@@ -32,33 +86,40 @@ class MarketDataService:
             self.logger.exception(f"An unexpected error occurred during API request for {url}: {e}")
             return None
 
-    async def fetch_market_data(self, session: aiohttp.ClientSession, headers: Dict) -> List[Dict]:
+    @staticmethod
+    def _retry_delay(retry_after: Optional[str], attempt: int) -> float:
+        """Returns the backoff before the next attempt, honouring a numeric Retry-After header."""
+        delay = 2 ** attempt
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(delay, MAX_RETRY_DELAY_SECONDS)
+
+    async def fetch_market_data(self, headers: Dict) -> List[Dict]:
         """
         Fetches live market data and merges it with cached static data for efficiency.
         """
-        today = datetime.now().date()
-        # Clear cache at the start of a new day
-        if self.last_cache_date != today:
-            self.logger.info("New day detected. Clearing static stock data cache.")
-            self.static_stock_data_cache.clear()
-            self.last_cache_date = today
-
         # Step 1: Always fetch the latest marketwatch data for live prices
-        url = f"{self.base_url}/assets/marketwatch?market=egypt"
-        live_data = await self.fetch_json(session, url, headers)
+        live_data = await self.fetch_json(self.marketwatch_url, headers)
         
         if not live_data or not live_data.get('assets'):
             return []
         
-        live_stocks = [x for x in live_data.get('assets', []) if x.get("market_id") == "NOPL"]
-        
-        # Step 2: Pre-filter based on live price
+        # Step 2: Keep main market stocks that pass the live price and blacklist
+        # filters, in a single pass over the marketwatch assets
+        min_price, max_price = self.min_price, self.max_price
+        blacklist_symbols = self.blacklist_symbols
         pre_filtered_stocks = [
-            stock for stock in live_stocks if self._meets_preliminary_criteria(stock)
+            stock for stock in live_data['assets']
+            if stock.get("market_id") == "NOPL"
+            and stock.get('symbol', '') not in blacklist_symbols
+            and min_price <= stock.get('last_trade_price', 0) <= max_price
         ]
 
         # Step 3: Enhance with cached static data, fetching only if necessary
-        fully_enhanced_stocks = await self._enhance_with_cache(session, headers, pre_filtered_stocks)
+        fully_enhanced_stocks = await self._enhance_with_cache(headers, pre_filtered_stocks)
 
         # Step 4: Apply final filters
         final_stocks = [
@@ -67,7 +128,7 @@ class MarketDataService:
         
         return final_stocks
 
-    async def _enhance_with_cache(self, session: aiohttp.ClientSession, headers: Dict, stocks: List[Dict]) -> List[Dict]:
+    async def _enhance_with_cache(self, headers: Dict, stocks: List[Dict]) -> List[Dict]:
         """
         Enhances a list of stocks with static data, using a cache to avoid redundant API calls.
         """
@@ -75,20 +136,20 @@ class MarketDataService:
         tasks_to_run = []
         stocks_to_enhance_map = {}
 
+        now = monotonic()
         for stock in stocks:
             asset_id = stock.get('asset_id')
             if not asset_id:
                 continue
             
-            if asset_id in self.static_stock_data_cache:
-                # Merge live data with cached static data
-                merged_stock = self.static_stock_data_cache[asset_id].copy()
-                merged_stock.update(stock)
-                enhanced_stocks.append(merged_stock)
+            cached = self._get_static_data(asset_id, now)
+            if cached is not None:
+                # Merge live data with cached static data; live values win
+                enhanced_stocks.append({**cached, **stock})
             else:
                 # If not in cache, schedule for fetching
                 if asset_id not in stocks_to_enhance_map:
-                    task = self._fetch_stock_details(session, headers, stock)
+                    task = self._fetch_stock_details(headers, stock)
                     tasks_to_run.append(task)
                     stocks_to_enhance_map[asset_id] = stock
 
@@ -99,46 +160,50 @@ class MarketDataService:
                 if isinstance(result, dict) and 'asset_id' in result:
                     asset_id = result['asset_id']
                     # Add to cache
-                    self.static_stock_data_cache[asset_id] = result
+                    self._cache_static_data(asset_id, result)
                     # Merge and add to the list for this run
-                    original_stock = stocks_to_enhance_map[asset_id]
-                    merged_stock = result.copy()
-                    merged_stock.update(original_stock)
-                    enhanced_stocks.append(merged_stock)
+                    enhanced_stocks.append({**result, **stocks_to_enhance_map[asset_id]})
                 elif isinstance(result, Exception):
                     self.logger.error(f"Error enhancing stock details: {result}")
 
         return enhanced_stocks
 
-    def _meets_preliminary_criteria(self, stock: Dict) -> bool:
-        """Checks criteria that can be evaluated with initial marketwatch data."""
-        strategy_config = self.config['strategy']
-        price = stock.get('last_trade_price', 0)
-        
-        return (
-            strategy_config.get('min_price', 0) <= price <= strategy_config.get('max_price', float('inf'))
-        )
+    def _get_static_data(self, asset_id: str, now: float) -> Optional[Dict]:
+        """Returns the cached static details of an asset, or None if missing or expired."""
+        entry = self.static_stock_data_cache.get(asset_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self.static_stock_data_cache[asset_id]
+            return None
+        self.static_stock_data_cache.move_to_end(asset_id)
+        return entry[1]
+
+    def _cache_static_data(self, asset_id: str, details: Dict):
+        """Caches the static details of an asset, evicting the least recently used entry when full."""
+        self.static_stock_data_cache[asset_id] = (monotonic() + self.static_cache_ttl, details)
+        self.static_stock_data_cache.move_to_end(asset_id)
+        if len(self.static_stock_data_cache) > STATIC_CACHE_MAX_ENTRIES:
+            self.static_stock_data_cache.popitem(last=False)
 
     def _meets_final_criteria(self, stock: Dict) -> bool:
         """Checks criteria that require detailed, enhanced stock data."""
-        strategy_config = self.config['strategy']
         market_cap = stock.get('market_cap', 0)
         symbol = stock.get('symbol', '')
         
         return (
+            symbol not in self.blacklist_symbols and
             market_cap is not None and
-            market_cap >= strategy_config.get('min_market_cap', 0) and
-            symbol not in strategy_config.get('blacklist_symbols', [])
+            market_cap >= self.min_market_cap
         )
 
-    async def _fetch_stock_details(self, session: aiohttp.ClientSession, headers: Dict, stock: Dict) -> Optional[Dict]:
+    async def _fetch_stock_details(self, headers: Dict, stock: Dict) -> Optional[Dict]:
         """Fetches the detailed (mostly static) data for a single stock."""
         asset_id = stock.get('asset_id')
         if not asset_id:
             return None
             
-        url = f"{self.base_url}/assets/{asset_id}?include_feed=true&feed_detail=true"
-        data = await self.fetch_json(session, url, headers)
+        data = await self.fetch_json(self.asset_details_url.format(asset_id), headers)
         
         if not data:
             return None
@@ -153,50 +218,128 @@ class MarketDataService:
             'feed_data': data.get('feed', {})
         }
 
-    async def fetch_historical_data(self, session: aiohttp.ClientSession, headers: Dict, asset_id: str) -> List[Dict]:
+    async def fetch_historical_data(self, headers: Dict, asset_id: str,
+                                    now_ms: Optional[int] = None) -> List[Dict]:
         """
         Fetches historical data by recursively fetching chunks backward in time
         until enough data points are collected.
+
+        Between cycles only the newest bars change, so once an asset's history
+        is cached just the bars since the last cached one are requested and
+        merged in, then cut to the window a full fetch would return.
+
+        now_ms lets a caller share one timestamp across all stocks of a cycle.
         """
-        all_points = []
         resolution = self.config.get('chart_resolution', 'five_minutes')
         chunk_duration_ms = 7 * 24 * 60 * 60 * 1000 
         
-        to_timestamp = int(datetime.now().timestamp() * 1000)
+        to_timestamp = now_ms if now_ms is not None else int(datetime.now().timestamp() * 1000)
+
+        window = None
+        cached = self.historical_data_cache.get(asset_id)
+        if cached and cached[1][-1]['time'] > to_timestamp - chunk_duration_ms:
+            covered_from, cached_points = cached
+            # Start just before the last cached bar so it is returned again:
+            # it may still have been forming when it was cached
+            last_time = cached_points[-1]['time']
+            url = f"{self.base_url}/charts/advanced?asset_id={asset_id}&resolution={resolution}&from_timestamp={last_time - 1}&to_timestamp={to_timestamp}"
+            data = await self.fetch_json(url, headers)
+
+            merged_points = cached_points
+            if data and data.get("points"):
+                new_points = data["points"]
+                first_new_time = new_points[0]['time']
+                merged_points = [p for p in cached_points if p['time'] < first_new_time] + new_points
+
+            window = self._slice_historical_window(merged_points, covered_from, to_timestamp, chunk_duration_ms)
+
+        if window is None:
+            window = await self._fetch_historical_chunks(headers, asset_id, resolution, to_timestamp, chunk_duration_ms)
+
+        all_points = window[1]
+        if not all_points:
+            self.historical_data_cache.pop(asset_id, None)
+            self.logger.warning(f"No historical points returned for {asset_id}")
+            return all_points
+
+        self.historical_data_cache[asset_id] = window
+        self.historical_data_cache.move_to_end(asset_id)
+        if len(self.historical_data_cache) > HISTORICAL_CACHE_MAX_ENTRIES:
+            self.historical_data_cache.popitem(last=False)
+
+        return all_points
+
+    async def _fetch_historical_chunks(self, headers: Dict, asset_id: str, resolution: str,
+                                       to_timestamp: int, chunk_duration_ms: int) -> Tuple[int, List[Dict]]:
+        """Returns the fetched points and the start of the oldest chunk requested."""
+        # Chunks arrive newest first; they are joined once at the end
+        chunks = []
+        point_count = 0
+        from_timestamp = to_timestamp
 
         for _ in range(5): 
-            if len(all_points) >= 100:
+            if point_count >= 100:
                 break
 
             from_timestamp = to_timestamp - chunk_duration_ms
             url = f"{self.base_url}/charts/advanced?asset_id={asset_id}&resolution={resolution}&from_timestamp={from_timestamp}&to_timestamp={to_timestamp}"
-            data = await self.fetch_json(session, url, headers)
+            data = await self.fetch_json(url, headers)
 
             if data and data.get("points"):
                 new_points = data["points"]
-                all_points = new_points + all_points
+                chunks.append(new_points)
+                point_count += len(new_points)
                 to_timestamp = new_points[0]['time']
             else:
                 break
-        
-        if not all_points:
-            self.logger.warning(f"No historical points returned for {asset_id}")
 
-        return all_points
+        return from_timestamp, list(chain.from_iterable(reversed(chunks)))
+
+    def _slice_historical_window(self, points: List[Dict], covered_from: int, now_ms: int,
+                                 chunk_duration_ms: int) -> Optional[Tuple[int, List[Dict]]]:
+        """
+        Walks the same chunks as a full fetch over already known points.
+
+        Returns:
+            Tuple of (start of the oldest chunk walked, points in the window), or
+            None when a chunk starts before covered_from, i.e. the window may
+            need bars that were never fetched
+        """
+        to_timestamp = now_ms
+        from_timestamp = now_ms
+        start = len(points)
+        for _ in range(5):
+            if len(points) - start >= 100:
+                break
+
+            from_timestamp = to_timestamp - chunk_duration_ms
+            if from_timestamp < covered_from:
+                return None
+
+            chunk_start = start
+            while chunk_start > 0 and points[chunk_start - 1]['time'] >= from_timestamp:
+                chunk_start -= 1
+            if chunk_start == start:
+                break
+
+            start = chunk_start
+            to_timestamp = points[start]['time']
+
+        return from_timestamp, points[start:]
     
-    async def fetch_market_depth(self, session: aiohttp.ClientSession, headers: Dict, asset_id: str) -> Dict:
+    async def fetch_market_depth(self, headers: Dict, asset_id: str) -> Dict:
         url = f"{self.base_url}/market-depth/{asset_id}"
-        data = await self.fetch_json(session, url, headers)
+        data = await self.fetch_json(url, headers)
         
         if not data:
             return {'bids_vol': 0, 'asks_vol': 0, 'spread': 0}
             
         return self._calculate_depth_metrics(data)
 
-    async def fetch_recent_trades(self, session: aiohttp.ClientSession, headers: Dict, asset_id: str) -> Dict:
+    async def fetch_recent_trades(self, headers: Dict, asset_id: str) -> Dict:
         """Fetch recent trades for a given asset and return trades and metrics."""
         url = f"{self.base_url}/market-depth/v2/trades-book/{asset_id}?page_size=50"
-        data = await self.fetch_json(session, url, headers)
+        data = await self.fetch_json(url, headers)
         
         if not data or 'trades' not in data:
             return {'trades': [], 'metrics': {}}
@@ -206,8 +349,20 @@ class MarketDataService:
         if not trades:
             return {'trades': [], 'metrics': {}}
 
-        total_volume = sum(trade.get('volume', 0) for trade in trades)
-        buy_volume = sum(trade.get('volume', 0) for trade in trades if trade.get('side') == 'BUY')
+        # Accumulate every metric in a single pass over the trades
+        total_volume = buy_volume = notional = 0
+        high_price = low_price = trades[0].get('price', 0)
+        for trade in trades:
+            volume = trade.get('volume', 0)
+            price = trade.get('price', 0)
+            total_volume += volume
+            notional += price * volume
+            if trade.get('side') == 'BUY':
+                buy_volume += volume
+            if price > high_price:
+                high_price = price
+            elif price < low_price:
+                low_price = price
         sell_volume = total_volume - buy_volume
         
         return {
@@ -217,10 +372,10 @@ class MarketDataService:
                 'buy_volume': buy_volume,
                 'sell_volume': sell_volume,
                 'buy_ratio': buy_volume / total_volume if total_volume > 0 else 0,
-                'average_price': sum(t.get('price', 0) * t.get('volume', 0) for t in trades) / total_volume if total_volume > 0 else 0,
+                'average_price': notional / total_volume if total_volume > 0 else 0,
                 'price_range': {
-                    'high': max(t.get('price', 0) for t in trades),
-                    'low': min(t.get('price', 0) for t in trades)
+                    'high': high_price,
+                    'low': low_price
                 }
             }
         }
@@ -229,17 +384,32 @@ class MarketDataService:
         bids = depth_data.get('bids_per_price', [])
         asks = depth_data.get('asks_per_price', [])
         
-        bids_vol = sum(b.get('volume_traded', 0) for b in bids)
-        asks_vol = sum(a.get('volume_traded', 0) for a in asks)
+        # One pass per side for both the volume and the best price level
+        bids_vol = 0
+        best_bid_price = None
+        for bid in bids:
+            bids_vol += bid.get('volume_traded', 0)
+            price = bid.get('order_price', 0)
+            if best_bid_price is None or price > best_bid_price:
+                best_bid_price = price
+
+        asks_vol = 0
+        best_ask_price = None
+        for ask in asks:
+            asks_vol += ask.get('volume_traded', 0)
+            price = ask.get('order_price', float('inf'))
+            if best_ask_price is None or price < best_ask_price:
+                best_ask_price = price
         
         spread = 0
         if bids and asks:
-            best_bid = max(bids, key=lambda x: x.get('order_price', 0))
-            best_ask = min(asks, key=lambda x: x.get('order_price', float('inf')))
-            spread = best_ask.get('order_price', 0) - best_bid.get('order_price', 0)
+            # A book whose asks all lack a price has no usable best ask
+            if best_ask_price == float('inf'):
+                best_ask_price = 0
+            spread = best_ask_price - best_bid_price
             
         return {
             'bids_vol': bids_vol,
             'asks_vol': asks_vol,
             'spread': spread
-        }
+        }
\ No newline at end of file
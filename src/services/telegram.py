@@ -1,20 +1,43 @@
 import aiohttp
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from ..database.models import Subscriber
 from datetime import datetime
 import asyncio
 
+# Telegram allows about 30 messages per second per bot, so broadcasts are sent
+# in batches of this size, at most one batch per second
+BROADCAST_BATCH_SIZE = 25
+
 class TelegramService:
     def __init__(self, config: Dict, db: Session):
         self.token = config['telegram_bot_token']
         self.base_url = f"https://api.telegram.org/bot{self.token}"
+        self.send_message_url = f"{self.base_url}/sendMessage"
+        self.get_updates_url = f"{self.base_url}/getUpdates"
+        # Telegram keeps returning updates until one is requested past them
+        self.update_offset = 0
         self.db = db
         self.logger = logging.getLogger(__name__)
+        # Created on first use so it binds to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the long-lived Bot API session, creating it if needed."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=100, limit_per_host=20, keepalive_timeout=60, ttl_dns_cache=600)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
+
+    async def aclose(self) -> None:
+        """Closes the Bot API session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
 
     async def send_message(self, chat_id: str, message: str, parse_mode: str = 'Markdown') -> bool:
-        url = f"{self.base_url}/sendMessage"
         data = {
             'chat_id': chat_id,
             'text': message,
@@ -22,16 +45,14 @@ class TelegramService:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=data) as response:
-                    return response.status == 200
+            session = await self._get_session()
+            async with session.post(self.send_message_url, data=data) as response:
+                return response.status == 200
         except Exception as e:
             self.logger.error(f"Failed to send Telegram message: {e}")
             return False
 
     async def broadcast_message(self, message: str) -> Dict[str, bool]:
-        results = {}
-        
         # --- FIX: Run the blocking DB call in a separate thread ---
         loop = asyncio.get_running_loop()
         try:
@@ -50,10 +71,25 @@ class TelegramService:
 
         self.logger.info(f"Broadcasting message to {len(subscribers)} subscribers.")
 
-        for subscriber in subscribers:
-            success = await self.send_message(subscriber.chat_id, message)
-            results[subscriber.chat_id] = success
-        
+        results = {}
+        chat_ids = [subscriber.chat_id for subscriber in subscribers]
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(chat_ids), BROADCAST_BATCH_SIZE):
+            if start:
+                # Wait out the rest of the second the previous batch started in
+                await asyncio.sleep(max(0.0, batch_started + 1.0 - loop.time()))
+            batch_started = loop.time()
+            batch = chat_ids[start:start + BROADCAST_BATCH_SIZE]
+            outcomes = await asyncio.gather(
+                *(self.send_message(chat_id, message) for chat_id in batch),
+                return_exceptions=True
+            )
+            for chat_id, outcome in zip(batch, outcomes):
+                if isinstance(outcome, BaseException):
+                    self.logger.error(f"Failed to send Telegram message to {chat_id}: {outcome}")
+                    outcome = False
+                results[chat_id] = outcome
+
         return results
     
     async def send_alert(self, alert_type: str, content: str, priority: str = 'normal') -> None:
@@ -77,31 +113,47 @@ class TelegramService:
         await self.broadcast_message(formatted_message)
 
     async def process_updates(self) -> None:
-        url = f"{self.base_url}/getUpdates"
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        await self._handle_updates(data.get('result', []))
+            session = await self._get_session()
+            # Short poll: this runs inline in the scan loop, so a long poll
+            # would hold up every market cycle
+            params = {'offset': self.update_offset, 'timeout': 0}
+            async with session.get(self.get_updates_url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    updates = data.get('result', [])
+                    # Only acknowledge updates once they are stored, so a failed
+                    # save is retried on the next poll
+                    if updates and await self._handle_updates(updates):
+                        self.update_offset = max(update['update_id'] for update in updates) + 1
         except Exception as e:
             self.logger.error(f"Failed to process Telegram updates: {e}")
 
-    async def _handle_updates(self, updates: List[Dict]) -> None:
+    async def _handle_updates(self, updates: List[Dict]) -> bool:
+        """Returns False if the updates could not be stored and must be fetched again."""
+        chat_ids = set()
         for update in updates:
             message = update.get('message', {})
             if message.get('text') == '/start':
                 chat_id = str(message.get('chat', {}).get('id'))
                 if chat_id:
-                    self._save_subscriber(chat_id)
+                    chat_ids.add(chat_id)
+        if chat_ids:
+            return self._save_subscribers(chat_ids)
+        return True
 
-    def _save_subscriber(self, chat_id: str) -> None:
+    def _save_subscribers(self, chat_ids: Set[str]) -> bool:
+        """Saves all /start senders of a batch in one insert, ignoring known chats."""
         try:
-            subscriber = Subscriber(chat_id=chat_id)
-            self.db.merge(subscriber)
+            statement = insert(Subscriber).values(
+                [{'chat_id': chat_id} for chat_id in chat_ids]
+            ).on_conflict_do_nothing(index_elements=['chat_id'])
+            result = self.db.execute(statement)
             self.db.commit()
-            self.logger.info(f"New subscriber saved: {chat_id}")
+            if result.rowcount:
+                self.logger.info(f"Saved {result.rowcount} new subscriber(s)")
+            return True
         except Exception as e:
             self.db.rollback()
-            self.logger.error(f"Failed to save subscriber: {e}")
\ No newline at end of file
+            self.logger.error(f"Failed to save subscribers: {e}")
+            return False
\ No newline at end of file
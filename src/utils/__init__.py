@@ -1,4 +1,6 @@
 from .rate_limiter import RateLimiter
 from .formatters import format_currency, format_percentage, format_date_time
+from .event_loop import install_uvloop
+from .serialization import json_dumps, json_loads
 
-__all__ = ['RateLimiter', 'format_currency', 'format_percentage', 'format_date_time']
\ No newline at end of file
+__all__ = ['RateLimiter', 'format_currency', 'format_percentage', 'format_date_time', 'install_uvloop', 'json_dumps', 'json_loads']
\ No newline at end of file
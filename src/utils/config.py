@@ -1,11 +1,15 @@
+from functools import lru_cache
 import json
 import os
 from typing import Dict
 
+@lru_cache(maxsize=1)
 def load_config() -> Dict:
     """
     Loads the configuration from config/config.json.
     It constructs an absolute path to the config file based on the location of this script.
+    The file is read once per process; callers share the returned dict and must
+    not modify it. Use load_config.cache_clear() to force a reload.
     """
   
     project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
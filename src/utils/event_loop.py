@@ -0,0 +1,17 @@
+import asyncio
+
+
+def install_uvloop() -> bool:
+    """
+    Install uvloop as the asyncio event loop policy when it is available.
+    
+    Returns:
+        True if uvloop was installed, False if the default event loop is kept
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
@@ -1,9 +1,5 @@
 from datetime import datetime
 from typing import Union, Optional
-import locale
-
-# Set locale for currency formatting
-locale.setlocale(locale.LC_ALL, '')
 
 def format_currency(value: Union[float, int], currency: str = 'EGP') -> str:
     """
@@ -17,9 +13,10 @@ def format_currency(value: Union[float, int], currency: str = 'EGP') -> str:
         Formatted currency string
     """
     try:
-        if abs(value) >= 1_000_000:
+        magnitude = abs(value)
+        if magnitude >= 1_000_000:
             return f"{value/1_000_000:.2f}M {currency}"
-        elif abs(value) >= 1_000:
+        elif magnitude >= 1_000:
             return f"{value/1_000:.1f}K {currency}"
         else:
             return f"{value:.2f} {currency}"
@@ -75,11 +72,12 @@ def format_large_number(value: Union[float, int]) -> str:
         Formatted number string
     """
     try:
-        if abs(value) >= 1_000_000_000:
+        magnitude = abs(value)
+        if magnitude >= 1_000_000_000:
             return f"{value/1_000_000_000:.2f}B"
-        elif abs(value) >= 1_000_000:
+        elif magnitude >= 1_000_000:
             return f"{value/1_000_000:.2f}M"
-        elif abs(value) >= 1_000:
+        elif magnitude >= 1_000:
             return f"{value/1_000:.1f}K"
         else:
             return f"{value:.0f}"
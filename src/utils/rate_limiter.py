@@ -1,25 +1,38 @@
 import asyncio
 import time
-from typing import List
+from collections import deque
+from typing import Deque
 
 class RateLimiter:
     def __init__(self, max_concurrent: int = 2, requests_per_minute: int = 60):
         self.semaphore = asyncio.Semaphore(max_concurrent)
-        self.request_times: List[float] = []
+        # Monotonic start times of the requests in the last minute, oldest first
+        self.request_times: Deque[float] = deque()
         self.max_per_minute = requests_per_minute
     
     async def acquire(self):
         await self.semaphore.acquire()
-        
-        now = time.time()
-        self.request_times = [t for t in self.request_times if now - t < 60]
-        
-        if len(self.request_times) >= self.max_per_minute:
-            sleep_time = 60 - (now - self.request_times[0])
-            if sleep_time > 0:
-                await asyncio.sleep(sleep_time)
-        
-        self.request_times.append(now)
+        try:
+            await self._wait_for_slot()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def _wait_for_slot(self):
+        request_times = self.request_times
+        while True:
+            # Nothing is awaited between the check and the append, so no other
+            # coroutine can take the slot in between; waiters re-check after
+            # sleeping instead of all claiming the slot they waited for
+            now = time.monotonic()
+            while request_times and now - request_times[0] >= 60:
+                request_times.popleft()
+            
+            if len(request_times) < self.max_per_minute:
+                request_times.append(now)
+                return
+            
+            await asyncio.sleep(60 - (now - request_times[0]))
     
     def release(self):
         self.semaphore.release()
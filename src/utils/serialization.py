@@ -0,0 +1,37 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse a JSON document, using orjson when it is installed.
+    
+    Args:
+        data: Raw JSON as bytes or str
+    
+    Returns:
+        The decoded Python object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    """
+    Serialize an object to a JSON string, using orjson when it is installed.
+    
+    Args:
+        obj: The Python object to encode
+    
+    Returns:
+        The encoded JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)